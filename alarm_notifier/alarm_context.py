@@ -0,0 +1,148 @@
+import dataclasses
+import logging
+import time
+import typing
+import urllib.parse
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+DESCRIBE_ALARMS_MAX_NAMES = 100
+
+
+@dataclasses.dataclass(frozen=True)
+class AlarmContext:
+    alarm_name: str
+    region: str
+    metric_name: typing.Optional[str] = None
+    namespace: typing.Optional[str] = None
+    threshold: typing.Optional[float] = None
+    comparison_operator: typing.Optional[str] = None
+    dimensions: typing.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    @property
+    def console_url(self) -> str:
+        return (
+            f"https://{self.region}.console.aws.amazon.com/cloudwatch/home"
+            f"?region={self.region}#alarmsV2:alarm/{urllib.parse.quote(self.alarm_name, safe='')}"
+        )
+
+    @classmethod
+    def from_metric_alarm(
+        cls, region: str, alarm: typing.Dict[str, typing.Any]
+    ) -> "AlarmContext":
+        return cls(
+            alarm_name=alarm["AlarmName"],
+            region=region,
+            metric_name=alarm.get("MetricName"),
+            namespace=alarm.get("Namespace"),
+            threshold=alarm.get("Threshold"),
+            comparison_operator=alarm.get("ComparisonOperator"),
+            dimensions={
+                dimension["Name"]: dimension["Value"]
+                for dimension in alarm.get("Dimensions", [])
+            },
+        )
+
+
+class AlarmContextCache:
+    def __init__(
+        self,
+        account_id: str,
+        ttl_seconds: float,
+        client_factory: typing.Callable[..., typing.Any] = boto3.client,
+        endpoint_urls: typing.Optional[typing.Dict[str, str]] = None,
+    ):
+        self._account_id = account_id
+        self._ttl_seconds = ttl_seconds
+        self._client_factory = client_factory
+        # region -> endpoint url, e.g. a vpc endpoint of the function's region
+        self._endpoint_urls = endpoint_urls or {}
+        self._clients: typing.Dict[str, typing.Any] = {}
+        # (account, region, alarm name) -> (expires at, context); None caches
+        # alarms that could not be described
+        self._entries: typing.Dict[
+            typing.Tuple[str, str, str],
+            typing.Tuple[float, typing.Optional[AlarmContext]],
+        ] = {}
+
+    def _client(self, region: str):
+        if region not in self._clients:
+            self._clients[region] = self._client_factory(
+                "cloudwatch",
+                region_name=region,
+                endpoint_url=self._endpoint_urls.get(region),
+            )
+
+        return self._clients[region]
+
+    def _is_fresh(self, key: typing.Tuple[str, str, str], now: float) -> bool:
+        return key in self._entries and self._entries[key][0] > now
+
+    def prefetch(self, alarms: typing.Iterable[typing.Tuple[str, str, str]]) -> None:
+        now = time.monotonic()
+
+        missing_by_region: typing.Dict[str, typing.Set[str]] = {}
+
+        for account_id, region, alarm_name in alarms:
+            # describe alarms only sees the function's own account, an alarm of
+            # another account with the same name would get the wrong context
+            if account_id != self._account_id:
+                continue
+
+            if not self._is_fresh((account_id, region, alarm_name), now):
+                missing_by_region.setdefault(region, set()).add(alarm_name)
+
+        for region, alarm_names in missing_by_region.items():
+            alarm_names = sorted(alarm_names)
+
+            for i in range(0, len(alarm_names), DESCRIBE_ALARMS_MAX_NAMES):
+                self._describe(region, alarm_names[i : i + DESCRIBE_ALARMS_MAX_NAMES])
+
+    def _describe(self, region: str, alarm_names: typing.List[str]) -> None:
+        logger.info(
+            "describing alarms", extra={"region": region, "alarm_names": alarm_names}
+        )
+
+        try:
+            response = self._client(region).describe_alarms(
+                AlarmNames=alarm_names,
+                AlarmTypes=["MetricAlarm", "CompositeAlarm"],
+                MaxRecords=DESCRIBE_ALARMS_MAX_NAMES,
+            )
+        except Exception:
+            logger.warning(
+                "describing alarms failed",
+                exc_info=True,
+                extra={"region": region, "alarm_names": alarm_names},
+            )
+
+            return
+
+        expires_at = time.monotonic() + self._ttl_seconds
+
+        for alarm_name in alarm_names:
+            self._entries[(self._account_id, region, alarm_name)] = (expires_at, None)
+
+        for alarm in response.get("MetricAlarms", []):
+            self._entries[(self._account_id, region, alarm["AlarmName"])] = (
+                expires_at,
+                AlarmContext.from_metric_alarm(region, alarm),
+            )
+
+        for alarm in response.get("CompositeAlarms", []):
+            self._entries[(self._account_id, region, alarm["AlarmName"])] = (
+                expires_at,
+                AlarmContext(alarm_name=alarm["AlarmName"], region=region),
+            )
+
+    def get(
+        self, account_id: str, region: str, alarm_name: str
+    ) -> typing.Optional[AlarmContext]:
+        entry = self._entries.get((account_id, region, alarm_name))
+
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+
+        return entry[1]
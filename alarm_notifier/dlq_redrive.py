@@ -0,0 +1,446 @@
+"""Redrive the alarm notifier dead letter queue into the main queue.
+
+Usage::
+
+    python -m alarm_notifier.dlq_redrive --dead-letter-queue-url ... --queue-url ... --rate 5
+
+The queue is processed in windows of ``--window-size`` dead letters, each
+received, planned and redriven before the next one is received, so at most a
+window is in flight. Duplicate events (same EventBridge ``id``) and transitions
+superseded by a later state of the same alarm are deleted instead of redriven,
+also when what they duplicate or supersede was redriven in an earlier window. A
+transition redriven before the window holding a later one cannot be taken back.
+``--dry-run`` plans the first window only.
+``--endpoint-url`` may point at a local SQS stand-in.
+"""
+
+import argparse
+import dataclasses
+import datetime
+import logging
+import time
+import typing
+
+import boto3
+import pydantic
+from aws_lambda_powertools.utilities.parser.models import SnsNotificationModel
+
+import alarm_notifier.events
+
+logger = logging.getLogger(__name__)
+
+SQS_BATCH_SIZE = 10
+# sqs rejects receives once a standard queue has this many messages in flight
+SQS_MAX_IN_FLIGHT = 120_000
+
+
+@dataclasses.dataclass
+class DeadLetter:
+    message_id: str
+    receipt_handle: str
+    body: str
+    message_attributes: typing.Dict[str, typing.Any] = dataclasses.field(
+        default_factory=dict
+    )
+    event_id: typing.Optional[str] = None
+    alarm_arns: typing.Optional[typing.Tuple[str, ...]] = None
+    time: typing.Optional[datetime.datetime] = None
+
+
+@dataclasses.dataclass
+class RedrivePlan:
+    to_redrive: typing.List[DeadLetter] = dataclasses.field(default_factory=list)
+    to_delete: typing.List[DeadLetter] = dataclasses.field(default_factory=list)
+
+
+def parse_dead_letter(message: typing.Dict[str, typing.Any]) -> DeadLetter:
+    dead_letter = DeadLetter(
+        message_id=message["MessageId"],
+        receipt_handle=message["ReceiptHandle"],
+        body=message["Body"],
+        message_attributes=message.get("MessageAttributes", {}),
+    )
+
+    try:
+        event = alarm_notifier.events.EventBridgeCloudWatchAlarmEvent.parse_raw(
+            SnsNotificationModel.parse_raw(message["Body"]).Message
+        )
+    except (pydantic.ValidationError, ValueError):
+        logger.warning(
+            "unable to parse dead letter, it will be redriven as is",
+            extra={"message_id": dead_letter.message_id},
+        )
+
+        return dead_letter
+
+    dead_letter.event_id = event.id
+    dead_letter.alarm_arns = tuple(sorted(event.resources))
+    dead_letter.time = event.time
+
+    return dead_letter
+
+
+class RedrivePlanner:
+    def __init__(self):
+        # what earlier windows redrove, later windows are planned against it
+        self._redriven_event_ids: typing.Set[str] = set()
+        self._redriven_times: typing.Dict[
+            typing.Tuple[str, ...], datetime.datetime
+        ] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._event_ids: typing.Set[str] = set()
+        self._latest: typing.Dict[typing.Tuple[str, ...], DeadLetter] = {}
+        self._unparsed: typing.List[DeadLetter] = []
+        self._to_delete: typing.List[DeadLetter] = []
+
+    def add(self, dead_letter: DeadLetter) -> None:
+        if dead_letter.event_id is None:
+            self._unparsed.append(dead_letter)
+
+            return
+
+        if (
+            dead_letter.event_id in self._event_ids
+            or dead_letter.event_id in self._redriven_event_ids
+        ):
+            self._to_delete.append(dead_letter)
+
+            return
+
+        self._event_ids.add(dead_letter.event_id)
+
+        redriven_time = self._redriven_times.get(dead_letter.alarm_arns)
+
+        if redriven_time is not None and dead_letter.time < redriven_time:
+            self._to_delete.append(dead_letter)
+
+            return
+
+        latest = self._latest.get(dead_letter.alarm_arns)
+
+        if latest is None or latest.time <= dead_letter.time:
+            self._latest[dead_letter.alarm_arns] = dead_letter
+
+            if latest is not None:
+                self._to_delete.append(latest)
+        else:
+            self._to_delete.append(dead_letter)
+
+    def plan(self) -> RedrivePlan:
+        plan = RedrivePlan(
+            to_redrive=sorted(self._latest.values(), key=lambda letter: letter.time)
+            + self._unparsed,
+            to_delete=list(self._to_delete),
+        )
+
+        self._reset()
+
+        return plan
+
+    def mark_redriven(self, dead_letters: typing.Iterable[DeadLetter]) -> None:
+        # letters that failed to send are not marked, they are planned again
+        # if they become visible while the redrive runs
+        for dead_letter in dead_letters:
+            if dead_letter.event_id is None:
+                continue
+
+            self._redriven_event_ids.add(dead_letter.event_id)
+            self._redriven_times[dead_letter.alarm_arns] = max(
+                dead_letter.time,
+                self._redriven_times.get(dead_letter.alarm_arns, dead_letter.time),
+            )
+
+
+def _chunks(
+    items: typing.Sequence[DeadLetter], size: int
+) -> typing.Iterator[typing.Sequence[DeadLetter]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _message_attributes(dead_letter: DeadLetter) -> typing.Dict[str, typing.Any]:
+    # received attributes carry list values that sqs rejects on send
+    return {
+        name: {
+            key: value
+            for key, value in attribute.items()
+            if key in ("DataType", "StringValue", "BinaryValue")
+        }
+        for name, attribute in dead_letter.message_attributes.items()
+    }
+
+
+def receive_dead_letters(
+    sqs_client,
+    queue_url: str,
+    visibility_timeout: int,
+    max_messages: typing.Optional[int] = None,
+) -> typing.Iterator[DeadLetter]:
+    received = 0
+
+    while max_messages is None or received < max_messages:
+        response = sqs_client.receive_message(
+            QueueUrl=queue_url,
+            # never receive more than asked for, extra messages would stay hidden
+            MaxNumberOfMessages=(
+                SQS_BATCH_SIZE
+                if max_messages is None
+                else min(SQS_BATCH_SIZE, max_messages - received)
+            ),
+            # e.g. the shadow attribute, which has to survive the redrive
+            MessageAttributeNames=["All"],
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=2,
+        )
+
+        messages = response.get("Messages", [])
+
+        if not messages:
+            return
+
+        for message in messages:
+            yield parse_dead_letter(message)
+
+        received += len(messages)
+
+
+def delete_dead_letters(
+    sqs_client, queue_url: str, dead_letters: typing.Sequence[DeadLetter]
+) -> None:
+    for chunk in _chunks(dead_letters, SQS_BATCH_SIZE):
+        response = sqs_client.delete_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": dead_letter.receipt_handle}
+                for i, dead_letter in enumerate(chunk)
+            ],
+        )
+
+        for failed in response.get("Failed", []):
+            logger.error(
+                "deleting dead letter failed",
+                extra={
+                    "message_id": chunk[int(failed["Id"])].message_id,
+                    "error": failed.get("Message"),
+                },
+            )
+
+
+def change_dead_letters_visibility(
+    sqs_client,
+    queue_url: str,
+    dead_letters: typing.Sequence[DeadLetter],
+    visibility_timeout: int,
+) -> None:
+    for chunk in _chunks(dead_letters, SQS_BATCH_SIZE):
+        response = sqs_client.change_message_visibility_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {
+                    "Id": str(i),
+                    "ReceiptHandle": dead_letter.receipt_handle,
+                    "VisibilityTimeout": visibility_timeout,
+                }
+                for i, dead_letter in enumerate(chunk)
+            ],
+        )
+
+        for failed in response.get("Failed", []):
+            logger.error(
+                "changing dead letter visibility failed",
+                extra={
+                    "message_id": chunk[int(failed["Id"])].message_id,
+                    "error": failed.get("Message"),
+                },
+            )
+
+
+def redrive_dead_letters(
+    sqs_client,
+    dead_letter_queue_url: str,
+    queue_url: str,
+    dead_letters: typing.Sequence[DeadLetter],
+    rate: float,
+    visibility_timeout: int,
+) -> typing.List[DeadLetter]:
+    started = time.monotonic()
+    extended = started
+    redriven = []
+
+    for offset in range(0, len(dead_letters), SQS_BATCH_SIZE):
+        chunk = dead_letters[offset : offset + SQS_BATCH_SIZE]
+
+        # pace the batches so the notifier sees at most `rate` messages per second
+        delay = started + len(redriven) / rate - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        # keep the letters not redriven yet hidden for as long as the redrive runs
+        if time.monotonic() - extended >= visibility_timeout / 2:
+            logger.info(
+                "extending dead letters visibility",
+                extra={"remaining": len(dead_letters) - offset},
+            )
+
+            change_dead_letters_visibility(
+                sqs_client,
+                dead_letter_queue_url,
+                dead_letters[offset:],
+                visibility_timeout,
+            )
+
+            extended = time.monotonic()
+
+        response = sqs_client.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {
+                    "Id": str(i),
+                    "MessageBody": dead_letter.body,
+                    "MessageAttributes": _message_attributes(dead_letter),
+                }
+                for i, dead_letter in enumerate(chunk)
+            ],
+        )
+
+        for failed in response.get("Failed", []):
+            logger.error(
+                "redriving dead letter failed",
+                extra={
+                    "message_id": chunk[int(failed["Id"])].message_id,
+                    "error": failed.get("Message"),
+                },
+            )
+
+        sent = [chunk[int(successful["Id"])] for successful in response["Successful"]]
+
+        delete_dead_letters(sqs_client, dead_letter_queue_url, sent)
+
+        redriven += sent
+
+        logger.info(
+            "redriving dead letters",
+            extra={"redriven": len(redriven), "total": len(dead_letters)},
+        )
+
+    return redriven
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m alarm_notifier.dlq_redrive")
+    parser.add_argument("--dead-letter-queue-url", required=True)
+    parser.add_argument("--queue-url", required=True)
+    parser.add_argument(
+        "--rate",
+        default=5.0,
+        type=float,
+        help="maximum number of messages redriven per second",
+    )
+    parser.add_argument(
+        "--visibility-timeout",
+        default=900,
+        type=int,
+        help="seconds the dead letters stay hidden, extended while the redrive runs (sqs caps it at 12 hours after receipt)",
+    )
+    parser.add_argument(
+        "--window-size",
+        default=10_000,
+        type=int,
+        help=f"maximum number of dead letters received and in flight at once (at most {SQS_MAX_IN_FLIGHT})",
+    )
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if not 0 < args.window_size < SQS_MAX_IN_FLIGHT:
+        parser.error(f"--window-size must be between 1 and {SQS_MAX_IN_FLIGHT - 1}")
+
+    logging.basicConfig(level=logging.INFO)
+
+    sqs_client = boto3.client("sqs", endpoint_url=args.endpoint_url)
+
+    planner = RedrivePlanner()
+    received = redriven = deleted = 0
+
+    while True:
+        window = list(
+            receive_dead_letters(
+                sqs_client,
+                args.dead_letter_queue_url,
+                args.visibility_timeout,
+                max_messages=args.window_size,
+            )
+        )
+
+        if not window:
+            break
+
+        for dead_letter in window:
+            planner.add(dead_letter)
+
+        received += len(window)
+        plan = planner.plan()
+
+        logger.info(
+            "planned redrive window",
+            extra={
+                "received": len(window),
+                "redrive": len(plan.to_redrive),
+                "delete": len(plan.to_delete),
+            },
+        )
+
+        if args.dry_run:
+            # make the dead letters available again right away, receiving
+            # another window would only get them back
+            change_dead_letters_visibility(
+                sqs_client,
+                args.dead_letter_queue_url,
+                window,
+                visibility_timeout=0,
+            )
+
+            if len(window) == args.window_size:
+                logger.warning(
+                    "dry run only planned the first window of dead letters",
+                    extra={"window_size": args.window_size},
+                )
+
+            return
+
+        delete_dead_letters(sqs_client, args.dead_letter_queue_url, plan.to_delete)
+
+        # the visibility timeout started when the letters were received
+        change_dead_letters_visibility(
+            sqs_client,
+            args.dead_letter_queue_url,
+            plan.to_redrive,
+            visibility_timeout=args.visibility_timeout,
+        )
+
+        sent = redrive_dead_letters(
+            sqs_client,
+            args.dead_letter_queue_url,
+            args.queue_url,
+            plan.to_redrive,
+            rate=args.rate,
+            visibility_timeout=args.visibility_timeout,
+        )
+
+        planner.mark_redriven(sent)
+
+        redriven += len(sent)
+        deleted += len(plan.to_delete)
+
+    logger.info(
+        "finished redriving dead letters",
+        extra={"received": received, "redriven": redriven, "deleted": deleted},
+    )
+
+
+if __name__ == "__main__":
+    main()
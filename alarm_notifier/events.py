@@ -0,0 +1,24 @@
+import enum
+
+import pydantic
+from aws_lambda_powertools.utilities.parser.models import EventBridgeModel
+
+
+class CloudWatchAlarmEventDetailStateValue(str, enum.Enum):
+    ALARM = "ALARM"
+    OK = "OK"
+    INSUFFICIENT_DATA = "INSUFFICIENT_DATA"
+
+
+class CloudWatchAlarmEventDetailState(pydantic.BaseModel):
+    reason: str
+    value: CloudWatchAlarmEventDetailStateValue
+
+
+class CloudWatchAlarmEventDetail(pydantic.BaseModel):
+    alarm_name: str = pydantic.Field(alias="alarmName")
+    state: CloudWatchAlarmEventDetailState
+
+
+class EventBridgeCloudWatchAlarmEvent(EventBridgeModel):
+    detail: CloudWatchAlarmEventDetail
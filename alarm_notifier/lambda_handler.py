@@ -1,29 +1,35 @@
 import dataclasses
-import enum
+import datetime
+import json
 import logging
 import os
+import time
 import typing
 
 import aws_lambda_powertools
+import aws_lambda_powertools.metrics
 import aws_lambda_powertools.utilities.batch
 import aws_lambda_powertools.utilities.data_classes.sqs_event
 import aws_lambda_powertools.utilities.idempotency
 import aws_lambda_powertools.utilities.parser
 import aws_lambda_powertools.utilities.parser.envelopes.event_bridge
 import aws_lambda_powertools.utilities.typing
-import pydantic
-import pynamodb.attributes
-import pynamodb.models
+import boto3
 import pythonjsonlogger.jsonlogger
 import sentry_sdk
 import slack_sdk
-import slack_sdk.errors
 from aws_lambda_powertools.utilities import parameters
-from aws_lambda_powertools.utilities.parser.models import EventBridgeModel
 from aws_lambda_powertools.utilities.parser.types import Model
 from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
 from sentry_sdk.integrations.logging import LoggingIntegration
 
+import alarm_notifier.alarm_context
+import alarm_notifier.events
+import alarm_notifier.models
+import alarm_notifier.sinks
+import alarm_notifier.slack_channels
+import alarm_notifier.slack_messages
+
 sentry_sdk.init(
     dsn=parameters.get_parameter(os.getenv("SENTRY_DSN_SECRET_NAME")),
     environment=parameters.get_parameter(os.getenv("SENTRY_ENV_SSM_PARAMETER_NAME")),
@@ -31,6 +37,13 @@ sentry_sdk.init(
         AwsLambdaIntegration(),
         LoggingIntegration(event_level=logging.CRITICAL),
     ],
+    sample_rate=float(os.getenv("SENTRY_ERROR_SAMPLE_RATE", "1.0")),
+    # unset keeps sentry performance monitoring disabled
+    traces_sample_rate=(
+        float(os.getenv("SENTRY_TRACES_SAMPLE_RATE"))
+        if os.getenv("SENTRY_TRACES_SAMPLE_RATE")
+        else None
+    ),
 )
 
 processor = aws_lambda_powertools.utilities.batch.BatchProcessor(
@@ -39,16 +52,51 @@ processor = aws_lambda_powertools.utilities.batch.BatchProcessor(
 
 tracer = aws_lambda_powertools.Tracer()
 
+# all: a subsegment per record, slow: only for records slower than the
+# threshold, off: no per record subsegments
+record_tracing_mode = os.getenv("RECORD_TRACING_MODE", "all").lower()
+
+slow_record_threshold_seconds = (
+    float(os.getenv("SLOW_RECORD_THRESHOLD_MS", "1000")) / 1000
+)
+
+metrics = aws_lambda_powertools.Metrics(
+    namespace="AlarmNotifier", service="alarm-notifier"
+)
+metrics.set_default_dimensions(shard=os.getenv("SHARD_NAME", "Default"))
+
+idempotency_table_name = parameters.get_parameter(
+    os.environ.get("IDEMPOTENCY_TABLE_NAME_SSM_PARAMETER_NAME")
+)
+
 dynamodb = aws_lambda_powertools.utilities.idempotency.DynamoDBPersistenceLayer(
-    table_name=parameters.get_parameter(
-        os.environ.get("IDEMPOTENCY_TABLE_NAME_SSM_PARAMETER_NAME")
-    )
+    table_name=idempotency_table_name
+)
+
+# the persistence layer is bound to the first function it serves, the shadow
+# handler needs its own
+shadow_dynamodb = aws_lambda_powertools.utilities.idempotency.DynamoDBPersistenceLayer(
+    table_name=idempotency_table_name
 )
 
 config = aws_lambda_powertools.utilities.idempotency.IdempotencyConfig(
     event_key_jmespath="id"
 )
 
+alarm_context_cache = (
+    alarm_notifier.alarm_context.AlarmContextCache(
+        account_id=os.getenv("ALARM_CONTEXT_ACCOUNT_ID"),
+        ttl_seconds=float(os.getenv("ALARM_CONTEXT_CACHE_TTL_SECONDS", "300")),
+        endpoint_urls=(
+            {os.getenv("AWS_REGION"): os.getenv("CLOUDWATCH_ENDPOINT_URL")}
+            if os.getenv("CLOUDWATCH_ENDPOINT_URL")
+            else None
+        ),
+    )
+    if os.getenv("ALARM_CONTEXT_ENRICHMENT_ENABLED", "false").lower() == "true"
+    else None
+)
+
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(
     pythonjsonlogger.jsonlogger.JsonFormatter(
@@ -65,41 +113,66 @@ console_handler.setFormatter(
 
 logging.basicConfig(handlers=[console_handler], level=logging.DEBUG, force=True)
 
-logger = logging.getLogger(__name__)
+# urllib3 logs request urls at debug level, webhook urls carry secrets
+logging.getLogger("urllib3").setLevel(logging.INFO)
 
+logger = logging.getLogger(__name__)
 
-class CloudWatchAlarmEventDetailStateValue(str, enum.Enum):
-    ALARM = "ALARM"
-    OK = "OK"
-    INSUFFICIENT_DATA = "INSUFFICIENT_DATA"
 
+def _slack_client() -> slack_sdk.WebClient:
+    return slack_sdk.WebClient(
+        token=parameters.get_parameter(os.getenv("SLACK_OAUTH_TOKEN_SECRET_NAME"))
+    )
 
-class CloudWatchAlarmEventDetailState(pydantic.BaseModel):
-    reason: str
-    value: CloudWatchAlarmEventDetailStateValue
 
+# built on the first route naming a channel and kept for the execution environment
+slack_channel_index = alarm_notifier.slack_channels.SlackChannelIndex(
+    client_factory=_slack_client,
+    ttl_seconds=float(os.getenv("SLACK_CHANNEL_INDEX_TTL_SECONDS", "3600")),
+)
 
-class CloudWatchAlarmEventDetail(pydantic.BaseModel):
-    alarm_name: str = pydantic.Field(alias="alarmName")
-    state: CloudWatchAlarmEventDetailState
+slack_message_update_mode = os.getenv("SLACK_MESSAGE_UPDATE_MODE", "off").lower()
 
+slack_message_store = (
+    alarm_notifier.slack_messages.SlackMessageStore(
+        ttl_seconds=float(os.getenv("SLACK_MESSAGE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+    )
+    if slack_message_update_mode
+    in (
+        alarm_notifier.slack_messages.UPDATE_MODE,
+        alarm_notifier.slack_messages.THREAD_MODE,
+    )
+    else None
+)
 
-class EventBridgeCloudWatchAlarmEvent(EventBridgeModel):
-    detail: CloudWatchAlarmEventDetail
+sinks = {
+    alarm_notifier.sinks.SLACK_SINK_TYPE: alarm_notifier.sinks.SlackSink(
+        client_factory=_slack_client,
+        channel_index=slack_channel_index,
+        message_store=slack_message_store,
+        update_mode=slack_message_update_mode,
+    ),
+    alarm_notifier.sinks.WEBHOOK_SINK_TYPE: alarm_notifier.sinks.WebhookSink(),
+}
+
+if os.getenv("SES_SENDER_ADDRESS"):
+    sinks[alarm_notifier.sinks.EMAIL_SINK_TYPE] = alarm_notifier.sinks.EmailSink(
+        ses_client=boto3.client("ses"), sender=os.getenv("SES_SENDER_ADDRESS")
+    )
 
+dispatcher = alarm_notifier.sinks.Dispatcher(sinks=sinks)
 
-class AlarmSlackWebhookModel(pynamodb.models.Model):
-    class Meta:
-        table_name = parameters.get_parameter(
-            os.getenv("ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_SSM_PARAMETER_NAME")
-        )
+# shadow records go through parsing, idempotency, routing and rendering as usual
+# but their notifications are recorded locally instead of being delivered
+shadow_mode = os.getenv("SHADOW_MODE", "false").lower() == "true"
 
-    alarm_arn = pynamodb.attributes.UnicodeAttribute(
-        hash_key=True, attr_name="AlarmArn"
-    )
-    slack_channel_id = pynamodb.attributes.UnicodeAttribute(
-        range_key=True, attr_name="SlackChannelId"
+shadow_dispatcher = alarm_notifier.sinks.Dispatcher(
+    sinks=alarm_notifier.sinks.RecordingSink.shadowing(
+        sinks=sinks,
+        path=os.getenv("SHADOW_LOG_PATH", "/tmp/alarm_notifier_shadow.jsonl"),
+        max_bytes=int(os.getenv("SHADOW_LOG_MAX_BYTES", str(64 * 1024 * 1024))),
     )
+)
 
 
 class UnknownAlarmStateError(Exception):
@@ -109,8 +182,11 @@ class UnknownAlarmStateError(Exception):
         return f"unknown alarm state '{self.state}'"
 
 
-def _build_slack_message(event: EventBridgeCloudWatchAlarmEvent):
-    if event.detail.state.value == CloudWatchAlarmEventDetailStateValue.ALARM:
+def _build_slack_message(event: alarm_notifier.events.EventBridgeCloudWatchAlarmEvent):
+    if (
+        event.detail.state.value
+        == alarm_notifier.events.CloudWatchAlarmEventDetailStateValue.ALARM
+    ):
         logger.debug("detected alarm state")
 
         return [
@@ -149,7 +225,10 @@ def _build_slack_message(event: EventBridgeCloudWatchAlarmEvent):
                 ],
             },
         ]
-    elif event.detail.state.value == CloudWatchAlarmEventDetailStateValue.OK:
+    elif (
+        event.detail.state.value
+        == alarm_notifier.events.CloudWatchAlarmEventDetailStateValue.OK
+    ):
         logger.debug("detected ok state")
 
         return [
@@ -190,7 +269,7 @@ def _build_slack_message(event: EventBridgeCloudWatchAlarmEvent):
         ]
     elif (
         event.detail.state.value
-        == CloudWatchAlarmEventDetailStateValue.INSUFFICIENT_DATA
+        == alarm_notifier.events.CloudWatchAlarmEventDetailStateValue.INSUFFICIENT_DATA
     ):
         logger.debug("detected insufficient data state")
 
@@ -236,6 +315,55 @@ def _build_slack_message(event: EventBridgeCloudWatchAlarmEvent):
         raise UnknownAlarmStateError(event.detail.state.value)
 
 
+def _build_alarm_context_blocks(
+    alarm_context: alarm_notifier.alarm_context.AlarmContext,
+):
+    fields = []
+
+    if alarm_context.metric_name:
+        fields += [
+            {"type": "mrkdwn", "text": "*Metric*"},
+            {"type": "mrkdwn", "text": "*Namespace*"},
+            {"type": "mrkdwn", "text": f"`{alarm_context.metric_name}`"},
+            {"type": "mrkdwn", "text": f"`{alarm_context.namespace}`"},
+        ]
+
+    if alarm_context.threshold is not None:
+        dimensions = ", ".join(
+            f"{name}={value}" for name, value in alarm_context.dimensions.items()
+        )
+
+        fields += [
+            {"type": "mrkdwn", "text": "*Threshold*"},
+            {"type": "mrkdwn", "text": "*Dimensions*"},
+            {
+                "type": "mrkdwn",
+                "text": f"`{alarm_context.comparison_operator} {alarm_context.threshold}`",
+            },
+            {
+                "type": "mrkdwn",
+                "text": f"`{dimensions or '-'}`",
+            },
+        ]
+
+    blocks = [{"type": "divider"}]
+
+    if fields:
+        blocks.append({"type": "section", "fields": fields})
+
+    blocks.append(
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"<{alarm_context.console_url}|View alarm in the CloudWatch console>",
+            },
+        }
+    )
+
+    return blocks
+
+
 @dataclasses.dataclass
 class SendAlarmNotificationToSlackWebhookError(Exception):
     alarm_arn: str
@@ -264,89 +392,267 @@ class SqsSnsEnvelope(aws_lambda_powertools.utilities.parser.envelopes.BaseEnvelo
         return self._parse(data=sns_record.Message, model=model)
 
 
-@tracer.capture_method
-def record_handler(
-    record: aws_lambda_powertools.utilities.data_classes.sqs_event.SQSRecord,
-):
-    event_handler(
-        event=aws_lambda_powertools.utilities.parser.parse(
-            envelope=SqsSnsEnvelope,
-            event=dict(record),
-            model=EventBridgeCloudWatchAlarmEvent,
+def _parse_record(
+    record: typing.Dict[str, typing.Any],
+) -> alarm_notifier.events.EventBridgeCloudWatchAlarmEvent:
+    return aws_lambda_powertools.utilities.parser.parse(
+        envelope=SqsSnsEnvelope,
+        event=record,
+        model=alarm_notifier.events.EventBridgeCloudWatchAlarmEvent,
+    )
+
+
+def _is_shadow_record(record: typing.Dict[str, typing.Any]) -> bool:
+    if shadow_mode:
+        return True
+
+    # raw message delivery puts the attribute on the sqs message, otherwise it
+    # is part of the sns notification
+    sqs_attribute = (record.get("messageAttributes") or {}).get("shadow") or {}
+
+    if sqs_attribute.get("stringValue", "").lower() == "true":
+        return True
+
+    try:
+        sns_attributes = json.loads(record["body"]).get("MessageAttributes") or {}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return False
+
+    return (sns_attributes.get("shadow") or {}).get("Value", "").lower() == "true"
+
+
+def _prefetch(event: typing.Dict[str, typing.Any]) -> None:
+    alarm_events = []
+
+    for record in event.get("Records", []):
+        try:
+            alarm_events.append(_parse_record(record))
+        except Exception:
+            # the record handler reports the failure for this record
+            continue
+
+    if alarm_context_cache is not None:
+        alarm_context_cache.prefetch(
+            (alarm_event.account, alarm_event.region, alarm_event.detail.alarm_name)
+            for alarm_event in alarm_events
+        )
+
+    if slack_message_store is not None:
+        slack_message_store.prefetch(
+            resource
+            for alarm_event in alarm_events
+            for resource in alarm_event.resources
+        )
+
+
+def _handle_record(record: typing.Dict[str, typing.Any]) -> None:
+    event = _parse_record(record)
+
+    if _is_shadow_record(record):
+        shadow_event_handler(event=event)
+    else:
+        event_handler(event=event)
+
+
+def _trace_slow_record(started: float, duration: float) -> None:
+    logger.info("slow record", extra={"duration_ms": round(duration * 1000, 3)})
+
+    # spans are opened after the fact so fast records pay for nothing but timing,
+    # named like the subsegments capture_method opens in all mode
+    subsegment = tracer.provider.begin_subsegment(name=f"## {__name__}.record_handler")
+
+    if subsegment is not None:
+        subsegment.start_time = started
+        subsegment.put_annotation(key="slow_record", value=True)
+
+        tracer.provider.end_subsegment(end_time=started + duration)
+
+    span = sentry_sdk.start_span(
+        op="record_handler",
+        start_timestamp=datetime.datetime.fromtimestamp(started, datetime.timezone.utc),
+    )
+    span.set_tag("slow_record", True)
+    span.finish(
+        end_timestamp=datetime.datetime.fromtimestamp(
+            started + duration, datetime.timezone.utc
         )
     )
 
 
-@aws_lambda_powertools.utilities.idempotency.idempotent_function(
-    data_keyword_argument="event", config=config, persistence_store=dynamodb
-)
-def event_handler(event: EventBridgeCloudWatchAlarmEvent):
-    slack_client = slack_sdk.WebClient(
-        token=parameters.get_parameter(os.getenv("SLACK_OAUTH_TOKEN_SECRET_NAME"))
+def record_handler(
+    record: aws_lambda_powertools.utilities.data_classes.sqs_event.SQSRecord,
+):
+    record = dict(record)
+
+    if record_tracing_mode != "slow":
+        _handle_record(record)
+
+        return
+
+    started = time.time()
+
+    try:
+        _handle_record(record)
+    finally:
+        duration = time.time() - started
+
+        if duration >= slow_record_threshold_seconds:
+            _trace_slow_record(started, duration)
+
+
+# capture_method records the response and exceptions as subsegment metadata
+if record_tracing_mode == "all":
+    record_handler = tracer.capture_method(record_handler)
+
+
+def _build_notification(
+    event: alarm_notifier.events.EventBridgeCloudWatchAlarmEvent,
+    alarm_arn: str,
+    slack_message: typing.List[typing.Dict[str, typing.Any]],
+) -> alarm_notifier.sinks.Notification:
+    return alarm_notifier.sinks.Notification(
+        alarm_arn=alarm_arn,
+        subject=f"{event.detail.state.value.value}: {event.detail.alarm_name}",
+        text=(
+            f"{event.detail.state.reason}\n\n"
+            f"Account: {event.account}\n"
+            f"Region: {event.region}\n"
+            f"ARNs: {', '.join(event.resources)}\n"
+            f"Timestamp: {event.time}"
+        ),
+        slack_blocks=slack_message,
+        state=event.detail.state.value.value,
+        payload={
+            "id": event.id,
+            "alarm_arn": alarm_arn,
+            "alarm_name": event.detail.alarm_name,
+            "state": event.detail.state.value.value,
+            "reason": event.detail.state.reason,
+            "account": event.account,
+            "region": event.region,
+            "time": event.time.isoformat(),
+        },
     )
 
+
+def _dispatch_event(
+    event: alarm_notifier.events.EventBridgeCloudWatchAlarmEvent, shadow: bool
+) -> None:
     slack_message = _build_slack_message(event)
 
+    if alarm_context_cache is not None:
+        alarm_context = alarm_context_cache.get(
+            event.account, event.region, event.detail.alarm_name
+        )
+
+        if alarm_context is not None:
+            slack_message += _build_alarm_context_blocks(alarm_context)
+
     logger.info("handling each event resource", extra={"resources": event.resources})
 
     for resource in event.resources:
-        logger.info(
-            "retrieving slack information for alarm", extra={"resource": resource}
-        )
+        logger.info("retrieving routes for alarm", extra={"resource": resource})
 
-        models = list(AlarmSlackWebhookModel.query(resource))
+        models = list(alarm_notifier.models.AlarmSlackWebhookModel.query(resource))
 
+        # route destinations may be webhook urls carrying secrets
         logger.info(
-            "retrieved slack information for alarm",
-            extra={"resource": resource, "models": models},
+            "retrieved routes for alarm",
+            extra={
+                "resource": resource,
+                "routes": len(models),
+                "sink_types": sorted(
+                    {
+                        model.sink_type or alarm_notifier.sinks.SLACK_SINK_TYPE
+                        for model in models
+                    }
+                ),
+            },
         )
 
         if len(models) == 0:
             logger.warning(
-                "no slack channels defined for alarm",
+                "no routes defined for alarm",
                 extra={"alarm_arn": resource},
             )
 
             continue
 
-        for model in models:
-            logger.info(
-                "sending alarm notification to slack channel",
-                extra={"slack_channel_id": model.slack_channel_id},
-            )
+        (shadow_dispatcher if shadow else dispatcher).dispatch(
+            notification=_build_notification(event, resource, slack_message),
+            routes=[
+                (
+                    model.sink_type or alarm_notifier.sinks.SLACK_SINK_TYPE,
+                    model.slack_channel_id,
+                )
+                for model in models
+            ],
+        )
 
-            response = slack_client.chat_postMessage(
-                blocks=slack_message, channel=model.slack_channel_id
-            )
+        metrics.add_metric(
+            name="ShadowNotificationsRecorded" if shadow else "NotificationsDispatched",
+            unit=aws_lambda_powertools.metrics.MetricUnit.Count,
+            value=len(models),
+        )
 
-            try:
-                response.validate()
-            except slack_sdk.errors.SlackApiError:
-                logger.exception(
-                    "sending alarm notification to slack channel failed",
-                    extra={
-                        "slack_channel_id": model.slack_channel_id,
-                        "message": slack_message,
-                    },
-                )
 
-                raise
-            else:
-                logger.info(
-                    "sent alarm notification to slack channel",
-                    extra={"slack_channel_id": model.slack_channel_id},
-                )
+@aws_lambda_powertools.utilities.idempotency.idempotent_function(
+    data_keyword_argument="event", config=config, persistence_store=dynamodb
+)
+def event_handler(event: alarm_notifier.events.EventBridgeCloudWatchAlarmEvent):
+    _dispatch_event(event, shadow=False)
 
 
+# idempotency keys are prefixed with the function name, shadowing an event
+# neither marks it as handled for event_handler nor reuses its result
+@aws_lambda_powertools.utilities.idempotency.idempotent_function(
+    data_keyword_argument="event", config=config, persistence_store=shadow_dynamodb
+)
+def shadow_event_handler(
+    event: alarm_notifier.events.EventBridgeCloudWatchAlarmEvent,
+):
+    _dispatch_event(event, shadow=True)
+
+
+@metrics.log_metrics
 @tracer.capture_lambda_handler
 def handler(event, context: aws_lambda_powertools.utilities.typing.LambdaContext):
     config.register_lambda_context(lambda_context=context)
 
     logger.debug("event", extra={"event": event})
 
-    return aws_lambda_powertools.utilities.batch.process_partial_response(
-        event=event,
-        record_handler=record_handler,
-        processor=processor,
-        context=context,
-    )
+    if alarm_context_cache is not None or slack_message_store is not None:
+        _prefetch(event)
+
+    # process_partial_response raises when every record of the batch failed,
+    # the whole batch counts as failed until it returns
+    records_failed = len(event.get("Records", []))
+
+    try:
+        response = aws_lambda_powertools.utilities.batch.process_partial_response(
+            event=event,
+            record_handler=record_handler,
+            processor=processor,
+            context=context,
+        )
+
+        records_failed = len(response.get("batchItemFailures", []))
+    finally:
+        # the timestamps of every post of the batch, including those of records
+        # that failed on another route, also when every record failed
+        if slack_message_store is not None:
+            slack_message_store.flush()
+
+        # log_metrics flushes the metrics when the handler raises too
+        metrics.add_metric(
+            name="RecordsReceived",
+            unit=aws_lambda_powertools.metrics.MetricUnit.Count,
+            value=len(event.get("Records", [])),
+        )
+        metrics.add_metric(
+            name="RecordsFailed",
+            unit=aws_lambda_powertools.metrics.MetricUnit.Count,
+            value=records_failed,
+        )
+
+    return response
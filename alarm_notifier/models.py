@@ -0,0 +1,55 @@
+import os
+import typing
+
+import pynamodb.attributes
+import pynamodb.models
+from aws_lambda_powertools.utilities import parameters
+
+
+def _get_table_name(
+    table_name_env: str, ssm_parameter_name_env: str
+) -> typing.Optional[str]:
+    if os.getenv(table_name_env):
+        return os.getenv(table_name_env)
+
+    # optional tables are left unresolved when the feature is not deployed
+    if os.getenv(ssm_parameter_name_env) is None:
+        return None
+
+    return parameters.get_parameter(os.getenv(ssm_parameter_name_env))
+
+
+class AlarmSlackWebhookModel(pynamodb.models.Model):
+    class Meta:
+        table_name = _get_table_name(
+            "ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_NAME",
+            "ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_SSM_PARAMETER_NAME",
+        )
+        host = os.getenv("DYNAMODB_ENDPOINT_URL")
+
+    alarm_arn = pynamodb.attributes.UnicodeAttribute(
+        hash_key=True, attr_name="AlarmArn"
+    )
+    # the destination of the route, a slack channel id, webhook url or email
+    # address depending on the sink type
+    slack_channel_id = pynamodb.attributes.UnicodeAttribute(
+        range_key=True, attr_name="SlackChannelId"
+    )
+    # routes written before sinks were introduced have no sink type and are slack
+    sink_type = pynamodb.attributes.UnicodeAttribute(attr_name="SinkType", null=True)
+
+
+class AlarmSlackMessageModel(pynamodb.models.Model):
+    class Meta:
+        table_name = _get_table_name(
+            "ALARM_SLACK_MESSAGES_DYNAMODB_TABLE_NAME",
+            "ALARM_SLACK_MESSAGES_DYNAMODB_TABLE_SSM_PARAMETER_NAME",
+        )
+        host = os.getenv("DYNAMODB_ENDPOINT_URL")
+
+    alarm_arn = pynamodb.attributes.UnicodeAttribute(
+        hash_key=True, attr_name="AlarmArn"
+    )
+    # slack channel id -> ts of the latest alarm post in that channel
+    message_timestamps = pynamodb.attributes.MapAttribute(attr_name="Ts", default=dict)
+    expiration = pynamodb.attributes.TTLAttribute(attr_name="expiration")
@@ -0,0 +1,368 @@
+"""Bulk import and export of the alarm to Slack channel routing table.
+
+Usage::
+
+    python -m alarm_notifier.routing_admin export --output routes.csv
+    python -m alarm_notifier.routing_admin import --input routes.jsonl --prune
+
+The table is resolved from ``ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_NAME`` (or the
+SSM parameter named by ``ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_SSM_PARAMETER_NAME``)
+and ``DYNAMODB_ENDPOINT_URL`` may point at a local DynamoDB stand-in.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import dataclasses
+import json
+import logging
+import math
+import os
+import sys
+import typing
+
+import slack_sdk
+
+import alarm_notifier.models
+import alarm_notifier.sinks
+import alarm_notifier.slack_channels
+
+logger = logging.getLogger(__name__)
+
+ALARM_ARN_FIELD = "AlarmArn"
+SLACK_CHANNEL_ID_FIELD = "SlackChannelId"
+SINK_TYPE_FIELD = "SinkType"
+
+
+@dataclasses.dataclass(frozen=True, order=True)
+class Route:
+    alarm_arn: str
+    slack_channel_id: str
+    sink_type: str = alarm_notifier.sinks.SLACK_SINK_TYPE
+
+    @property
+    def key(self) -> typing.Tuple[str, str]:
+        return self.alarm_arn, self.slack_channel_id
+
+
+@dataclasses.dataclass
+class RouteDiff:
+    to_put: typing.List[Route]
+    to_delete: typing.List[Route]
+
+
+@dataclasses.dataclass
+class UnknownSlackChannelsError(Exception):
+    slack_channel_ids: typing.List[str]
+
+    def __str__(self) -> str:
+        return f"unknown slack channels [slack_channel_ids: {', '.join(self.slack_channel_ids)}]"
+
+
+@dataclasses.dataclass
+class DuplicateRoutesError(Exception):
+    keys: typing.List[typing.Tuple[str, str]]
+
+    def __str__(self) -> str:
+        return f"routes defined more than once with different sink types [keys: {', '.join(f'{alarm_arn} {slack_channel_id}' for alarm_arn, slack_channel_id in self.keys)}]"
+
+
+@dataclasses.dataclass
+class InvalidRoutesError(Exception):
+    # (route, reason)
+    routes: typing.List[typing.Tuple[Route, str]]
+
+    def __str__(self) -> str:
+        return f"invalid routes [routes: {'; '.join(f'{route.alarm_arn} {route.sink_type} {route.slack_channel_id}: {reason}' for route, reason in self.routes)}]"
+
+
+def _scan_segment(segment: int, total_segments: int) -> typing.List[Route]:
+    return [
+        Route(
+            alarm_arn=model.alarm_arn,
+            slack_channel_id=model.slack_channel_id,
+            sink_type=model.sink_type or alarm_notifier.sinks.SLACK_SINK_TYPE,
+        )
+        for model in alarm_notifier.models.AlarmSlackWebhookModel.scan(
+            segment=segment, total_segments=total_segments
+        )
+    ]
+
+
+def scan_routes(total_segments: int) -> typing.Set[Route]:
+    logger.info("scanning routes", extra={"total_segments": total_segments})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=total_segments) as executor:
+        segments = executor.map(
+            _scan_segment, range(total_segments), [total_segments] * total_segments
+        )
+
+        routes = {route for segment in segments for route in segment}
+
+    logger.info("scanned routes", extra={"count": len(routes)})
+
+    return routes
+
+
+def read_routes(file: typing.TextIO, file_format: str) -> typing.Set[Route]:
+    if file_format == "csv":
+        rows = csv.DictReader(file)
+    else:
+        rows = (json.loads(line) for line in file if line.strip())
+
+    routes_by_key: typing.Dict[typing.Tuple[str, str], Route] = {}
+    duplicate_keys = set()
+
+    for row in rows:
+        route = Route(
+            alarm_arn=row[ALARM_ARN_FIELD].strip(),
+            slack_channel_id=row[SLACK_CHANNEL_ID_FIELD].strip(),
+            sink_type=(row.get(SINK_TYPE_FIELD) or "").strip()
+            or alarm_notifier.sinks.SLACK_SINK_TYPE,
+        )
+
+        # the same key twice would be written in no particular order, or be
+        # rejected by BatchWriteItem
+        if routes_by_key.get(route.key, route) != route:
+            duplicate_keys.add(route.key)
+
+        routes_by_key[route.key] = route
+
+    if duplicate_keys:
+        raise DuplicateRoutesError(sorted(duplicate_keys))
+
+    return set(routes_by_key.values())
+
+
+def write_routes(
+    file: typing.TextIO, file_format: str, routes: typing.Iterable[Route]
+) -> None:
+    if file_format == "csv":
+        writer = csv.DictWriter(
+            file, fieldnames=[ALARM_ARN_FIELD, SLACK_CHANNEL_ID_FIELD, SINK_TYPE_FIELD]
+        )
+        writer.writeheader()
+
+    for route in sorted(routes):
+        row = {
+            ALARM_ARN_FIELD: route.alarm_arn,
+            SLACK_CHANNEL_ID_FIELD: route.slack_channel_id,
+            SINK_TYPE_FIELD: route.sink_type,
+        }
+
+        if file_format == "csv":
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(row) + "\n")
+
+
+def validate_routes(routes: typing.Iterable[Route]) -> None:
+    invalid_routes = []
+
+    for route in sorted(routes):
+        # the notifier skips routes it cannot deliver, reject them up front
+        if route.sink_type not in alarm_notifier.sinks.SINK_TYPES:
+            invalid_routes.append((route, "unknown sink type"))
+        elif (
+            route.sink_type == alarm_notifier.sinks.WEBHOOK_SINK_TYPE
+            and not alarm_notifier.sinks.is_secure_webhook_url(route.slack_channel_id)
+        ):
+            invalid_routes.append((route, "webhook url must use https"))
+
+    if invalid_routes:
+        raise InvalidRoutesError(invalid_routes)
+
+
+def diff_routes(
+    current: typing.Set[Route], desired: typing.Set[Route], prune: bool
+) -> RouteDiff:
+    # pruning only touches alarms present in the file, other alarms are left alone
+    desired_alarm_arns = {route.alarm_arn for route in desired}
+    # a route whose sink type changed is overwritten, not deleted
+    desired_keys = {route.key for route in desired}
+
+    return RouteDiff(
+        to_put=sorted(desired - current),
+        to_delete=sorted(
+            route
+            for route in current - desired
+            if prune
+            and route.alarm_arn in desired_alarm_arns
+            and route.key not in desired_keys
+        ),
+    )
+
+
+def validate_slack_channels(
+    slack_client: slack_sdk.WebClient, routes: typing.Iterable[Route]
+) -> None:
+    slack_channels = {
+        route.slack_channel_id
+        for route in routes
+        if route.sink_type == alarm_notifier.sinks.SLACK_SINK_TYPE
+    }
+
+    if not slack_channels:
+        return
+
+    # one paginated listing instead of a conversations.info call per channel,
+    # names missing from it are unknown rather than a reason to list again
+    slack_channel_index = alarm_notifier.slack_channels.SlackChannelIndex(
+        client_factory=lambda: slack_client,
+        min_refresh_interval_seconds=math.inf,
+    )
+
+    known_slack_channel_ids = slack_channel_index.channel_ids()
+
+    unknown_slack_channels = []
+
+    for slack_channel in sorted(slack_channels):
+        try:
+            slack_channel_id = slack_channel_index.resolve(slack_channel)
+        except alarm_notifier.slack_channels.UnknownSlackChannelError:
+            unknown_slack_channels.append(slack_channel)
+        else:
+            if slack_channel_id not in known_slack_channel_ids:
+                unknown_slack_channels.append(slack_channel)
+
+    if unknown_slack_channels:
+        raise UnknownSlackChannelsError(unknown_slack_channels)
+
+
+def _write_chunk(to_put: typing.List[Route], to_delete: typing.List[Route]) -> None:
+    # batch_write flushes every 25 items and retries unprocessed items
+    with alarm_notifier.models.AlarmSlackWebhookModel.batch_write() as batch:
+        for route in to_put:
+            batch.save(
+                alarm_notifier.models.AlarmSlackWebhookModel(
+                    route.alarm_arn, route.slack_channel_id, sink_type=route.sink_type
+                )
+            )
+
+        for route in to_delete:
+            batch.delete(
+                alarm_notifier.models.AlarmSlackWebhookModel(
+                    route.alarm_arn, route.slack_channel_id
+                )
+            )
+
+
+def apply_diff(diff: RouteDiff, workers: int) -> None:
+    logger.info(
+        "applying route changes",
+        extra={"put": len(diff.to_put), "delete": len(diff.to_delete)},
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _write_chunk,
+                diff.to_put[worker::workers],
+                diff.to_delete[worker::workers],
+            )
+            for worker in range(workers)
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    logger.info("applied route changes")
+
+
+def _export(args: argparse.Namespace) -> None:
+    routes = scan_routes(total_segments=args.segments)
+
+    if args.output == "-":
+        write_routes(sys.stdout, args.format, routes)
+    else:
+        with open(args.output, "w", newline="") as file:
+            write_routes(file, args.format, routes)
+
+
+def _import(args: argparse.Namespace) -> None:
+    with open(args.input, newline="") as file:
+        desired = read_routes(file, args.format)
+
+    validate_routes(desired)
+
+    diff = diff_routes(
+        current=scan_routes(total_segments=args.segments),
+        desired=desired,
+        prune=args.prune,
+    )
+
+    if not args.skip_slack_validation:
+        validate_slack_channels(
+            slack_client=slack_sdk.WebClient(token=os.environ["SLACK_OAUTH_TOKEN"]),
+            routes=diff.to_put,
+        )
+
+    for route in diff.to_put:
+        print(f"+ {route.alarm_arn} {route.sink_type} {route.slack_channel_id}")
+
+    for route in diff.to_delete:
+        print(f"- {route.alarm_arn} {route.sink_type} {route.slack_channel_id}")
+
+    if args.dry_run:
+        return
+
+    apply_diff(diff, workers=args.workers)
+
+
+def _format(path: str, file_format: typing.Optional[str]) -> str:
+    if file_format:
+        return file_format
+
+    return "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m alarm_notifier.routing_admin")
+    parser.add_argument(
+        "--segments",
+        default=8,
+        type=int,
+        help="number of parallel scan segments",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="export routes to a file")
+    export_parser.add_argument("--output", default="-")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"])
+    export_parser.set_defaults(func=_export)
+
+    import_parser = subparsers.add_parser(
+        "import", help="apply the routes in a file to the table"
+    )
+    import_parser.add_argument("--input", required=True)
+    import_parser.add_argument("--format", choices=["csv", "jsonl"])
+    import_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="delete routes of the imported alarms that are not in the file",
+    )
+    import_parser.add_argument("--dry-run", action="store_true")
+    import_parser.add_argument(
+        "--skip-slack-validation",
+        action="store_true",
+        help="do not check channel ids against Slack (SLACK_OAUTH_TOKEN)",
+    )
+    import_parser.add_argument(
+        "--workers",
+        default=8,
+        type=int,
+        help="number of parallel batch writers",
+    )
+    import_parser.set_defaults(func=_import)
+
+    args = parser.parse_args(argv)
+    args.format = _format(getattr(args, "input", None) or args.output, args.format)
+
+    logging.basicConfig(level=logging.INFO)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
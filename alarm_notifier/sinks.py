@@ -0,0 +1,516 @@
+import abc
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import urllib.error
+import urllib.parse
+
+import botocore.exceptions
+import requests
+import slack_sdk
+import slack_sdk.errors
+
+import alarm_notifier.events
+import alarm_notifier.slack_channels
+import alarm_notifier.slack_messages
+
+logger = logging.getLogger(__name__)
+
+SLACK_SINK_TYPE = "slack"
+WEBHOOK_SINK_TYPE = "webhook"
+EMAIL_SINK_TYPE = "email"
+
+SINK_TYPES = (SLACK_SINK_TYPE, WEBHOOK_SINK_TYPE, EMAIL_SINK_TYPE)
+
+SLACK_TRANSIENT_ERRORS = {
+    "fatal_error",
+    "internal_error",
+    "ratelimited",
+    "request_timeout",
+    "service_unavailable",
+}
+
+SES_TRANSIENT_ERRORS = {
+    "InternalFailure",
+    "ServiceUnavailable",
+    "Throttling",
+    "ThrottlingException",
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Notification:
+    alarm_arn: str
+    subject: str
+    text: str
+    slack_blocks: typing.List[typing.Dict[str, typing.Any]]
+    payload: typing.Dict[str, typing.Any]
+    state: typing.Optional[str] = None
+    created_at: float = dataclasses.field(default_factory=time.monotonic)
+
+    def render(self, sink_type: str) -> typing.Any:
+        if sink_type == SLACK_SINK_TYPE:
+            return self.slack_blocks
+        elif sink_type == EMAIL_SINK_TYPE:
+            return {"subject": self.subject, "text": self.text}
+        else:
+            return self.payload
+
+
+@dataclasses.dataclass(frozen=True)
+class DeliveryPolicy:
+    max_batch_size: int = 1
+    max_attempts: int = 3
+    backoff_seconds: float = 0.5
+    max_requests_per_second: typing.Optional[float] = None
+
+
+class RateLimiter:
+    def __init__(self, max_requests_per_second: typing.Optional[float]):
+        self._interval = 1 / max_requests_per_second if max_requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Sink(abc.ABC):
+    def __init__(self, policy: DeliveryPolicy):
+        self.policy = policy
+        self.rate_limiter = RateLimiter(policy.max_requests_per_second)
+
+    @abc.abstractmethod
+    def send(self, notification: Notification, targets: typing.Sequence[str]) -> None:
+        ...
+
+    def is_transient(self, error: Exception) -> bool:
+        # only transient errors are retried, anything else fails right away
+        return False
+
+
+def _is_transient_status_code(status_code: typing.Optional[int]) -> bool:
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+@dataclasses.dataclass
+class InsecureWebhookUrlError(Exception):
+    scheme: str
+
+    def __str__(self) -> str:
+        return f"webhook url must use https [scheme: {self.scheme}]"
+
+
+@dataclasses.dataclass
+class WebhookDeliveryError(Exception):
+    # None when no response was received
+    status_code: typing.Optional[int]
+    reason: str
+
+    def __str__(self) -> str:
+        return f"delivering alarm notification to webhook failed [status_code: {self.status_code}, reason: {self.reason}]"
+
+
+def is_secure_webhook_url(url: str) -> bool:
+    return urllib.parse.urlsplit(url).scheme == "https"
+
+
+class SlackSink(Sink):
+    def __init__(
+        self,
+        client_factory: typing.Callable[[], slack_sdk.WebClient],
+        channel_index: typing.Optional[
+            alarm_notifier.slack_channels.SlackChannelIndex
+        ] = None,
+        message_store: typing.Optional[
+            alarm_notifier.slack_messages.SlackMessageStore
+        ] = None,
+        update_mode: str = alarm_notifier.slack_messages.UPDATE_MODE,
+        policy: DeliveryPolicy = DeliveryPolicy(max_requests_per_second=20),
+    ):
+        super().__init__(policy=policy)
+        self._client_factory = client_factory
+        self._message_store = message_store
+        self._update_mode = update_mode
+        self._channel_index = channel_index or (
+            alarm_notifier.slack_channels.SlackChannelIndex(
+                client_factory=client_factory
+            )
+        )
+
+    def _deliver(
+        self,
+        slack_client: slack_sdk.WebClient,
+        notification: Notification,
+        slack_channel_id: str,
+    ) -> None:
+        is_alarm = (
+            notification.state
+            == alarm_notifier.events.CloudWatchAlarmEventDetailStateValue.ALARM.value
+        )
+
+        ts = (
+            self._message_store.get(notification.alarm_arn, slack_channel_id)
+            if self._message_store is not None and not is_alarm
+            else None
+        )
+
+        if ts is not None:
+            try:
+                if self._update_mode == alarm_notifier.slack_messages.THREAD_MODE:
+                    slack_client.chat_postMessage(
+                        blocks=notification.slack_blocks,
+                        channel=slack_channel_id,
+                        thread_ts=ts,
+                    )
+                else:
+                    slack_client.chat_update(
+                        blocks=notification.slack_blocks,
+                        channel=slack_channel_id,
+                        ts=ts,
+                    )
+
+                return
+            except slack_sdk.errors.SlackApiError as e:
+                if e.response.get("error") not in (
+                    "message_not_found",
+                    "thread_not_found",
+                ):
+                    raise
+
+                logger.warning(
+                    "original alarm message not found in slack channel, posting a new message",
+                    extra={"slack_channel_id": slack_channel_id, "ts": ts},
+                )
+
+        response = slack_client.chat_postMessage(
+            blocks=notification.slack_blocks, channel=slack_channel_id
+        )
+
+        if self._message_store is not None and is_alarm:
+            self._message_store.put(
+                notification.alarm_arn, slack_channel_id, response["ts"]
+            )
+
+    def _post(
+        self,
+        slack_client: slack_sdk.WebClient,
+        notification: Notification,
+        slack_channel: str,
+    ) -> None:
+        try:
+            self._deliver(
+                slack_client,
+                notification,
+                self._channel_index.resolve(slack_channel),
+            )
+
+            return
+        except slack_sdk.errors.SlackApiError as e:
+            if not (
+                alarm_notifier.slack_channels.is_channel_name(slack_channel)
+                and e.response.get("error") == "channel_not_found"
+            ):
+                raise
+
+        # the channel was renamed or recreated since the index was built, later
+        # records use the rebuilt index
+        self._channel_index.refresh_in_background()
+
+        raise alarm_notifier.slack_channels.UnknownSlackChannelError(slack_channel)
+
+    def is_transient(self, error: Exception) -> bool:
+        if isinstance(error, slack_sdk.errors.SlackApiError):
+            return (
+                _is_transient_status_code(error.response.status_code)
+                or error.response.get("error") in SLACK_TRANSIENT_ERRORS
+            )
+
+        # network errors of the urllib based web client
+        return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+    def send(self, notification: Notification, targets: typing.Sequence[str]) -> None:
+        slack_client = self._client_factory()
+
+        for slack_channel_id in targets:
+            logger.info(
+                "sending alarm notification to slack channel",
+                extra={"slack_channel_id": slack_channel_id},
+            )
+
+            try:
+                self._post(slack_client, notification, slack_channel_id)
+            except alarm_notifier.slack_channels.UnknownSlackChannelError:
+                # failing the record would only redeliver to the other routes on
+                # every sqs retry
+                logger.error(
+                    "unknown slack channel, skipping the route",
+                    extra={"slack_channel_id": slack_channel_id},
+                )
+            except slack_sdk.errors.SlackApiError:
+                logger.exception(
+                    "sending alarm notification to slack channel failed",
+                    extra={
+                        "slack_channel_id": slack_channel_id,
+                        "message": notification.slack_blocks,
+                    },
+                )
+
+                raise
+            else:
+                logger.info(
+                    "sent alarm notification to slack channel",
+                    extra={"slack_channel_id": slack_channel_id},
+                )
+
+
+class WebhookSink(Sink):
+    def __init__(
+        self,
+        session: typing.Optional[requests.Session] = None,
+        timeout_seconds: float = 10,
+        policy: DeliveryPolicy = DeliveryPolicy(max_requests_per_second=10),
+    ):
+        super().__init__(policy=policy)
+        self._session = session or requests.Session()
+        self._timeout_seconds = timeout_seconds
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, WebhookDeliveryError) and _is_transient_status_code(
+            error.status_code
+        )
+
+    def send(self, notification: Notification, targets: typing.Sequence[str]) -> None:
+        for url in targets:
+            if not is_secure_webhook_url(url):
+                raise InsecureWebhookUrlError(urllib.parse.urlsplit(url).scheme)
+
+            logger.info("sending alarm notification to webhook")
+
+            # webhook urls carry the integration secret, the errors of requests
+            # quote them and are not chained
+            try:
+                response = self._session.post(
+                    url, json=notification.payload, timeout=self._timeout_seconds
+                )
+
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise WebhookDeliveryError(
+                    status_code=(
+                        e.response.status_code if e.response is not None else None
+                    ),
+                    reason=type(e).__name__,
+                ) from None
+
+            logger.info(
+                "sent alarm notification to webhook",
+                extra={"status_code": response.status_code},
+            )
+
+
+class EmailSink(Sink):
+    def __init__(
+        self,
+        ses_client,
+        sender: str,
+        # SES accepts up to 50 recipients per message
+        policy: DeliveryPolicy = DeliveryPolicy(
+            max_batch_size=50, max_requests_per_second=1
+        ),
+    ):
+        super().__init__(policy=policy)
+        self._ses_client = ses_client
+        self._sender = sender
+
+    def is_transient(self, error: Exception) -> bool:
+        if isinstance(error, botocore.exceptions.ClientError):
+            return error.response["Error"]["Code"] in SES_TRANSIENT_ERRORS
+
+        return isinstance(
+            error,
+            (
+                botocore.exceptions.ConnectionError,
+                botocore.exceptions.HTTPClientError,
+            ),
+        )
+
+    def send(self, notification: Notification, targets: typing.Sequence[str]) -> None:
+        logger.info(
+            "sending alarm notification email", extra={"recipients": len(targets)}
+        )
+
+        self._ses_client.send_email(
+            Source=self._sender,
+            Destination={"BccAddresses": list(targets)},
+            Message={
+                "Subject": {"Data": notification.subject},
+                "Body": {"Text": {"Data": notification.text}},
+            },
+        )
+
+        logger.info("sent alarm notification email", extra={"recipients": len(targets)})
+
+
+class RecordingSink(Sink):
+    _lock = threading.Lock()
+
+    def __init__(
+        self, sink_type: str, path: str, max_bytes: int, policy: DeliveryPolicy
+    ):
+        super().__init__(policy=policy)
+        self._sink_type = sink_type
+        self._path = path
+        self._max_bytes = max_bytes
+
+    def send(self, notification: Notification, targets: typing.Sequence[str]) -> None:
+        started = time.monotonic()
+        payload = json.dumps(
+            notification.render(self._sink_type), separators=(",", ":"), default=str
+        )
+
+        entry = {
+            "ts": time.time(),
+            "sink": self._sink_type,
+            "alarm_arn": notification.alarm_arn,
+            "target_count": len(targets),
+            # time from rendering the notification to handing it to the sink
+            "dispatch_ms": round((started - notification.created_at) * 1000, 3),
+            "bytes": len(payload),
+            "payload": payload,
+        }
+
+        # webhook urls carry secrets and email addresses are personal data,
+        # only slack channels are recorded
+        if self._sink_type == SLACK_SINK_TYPE:
+            entry["targets"] = list(targets)
+
+        line = json.dumps(entry, separators=(",", ":"))
+
+        with self._lock:
+            with open(self._path, "a") as log:
+                log.write(line + "\n")
+                size = log.tell()
+
+            # keep the log and its previous generation within the ephemeral storage
+            if size >= self._max_bytes:
+                os.replace(self._path, f"{self._path}.1")
+
+    @classmethod
+    def shadowing(
+        cls, sinks: typing.Dict[str, Sink], path: str, max_bytes: int
+    ) -> typing.Dict[str, Sink]:
+        # same batching as the real sinks, without their retries and rate limits
+        return {
+            sink_type: cls(
+                sink_type=sink_type,
+                path=path,
+                max_bytes=max_bytes,
+                policy=DeliveryPolicy(max_batch_size=sink.policy.max_batch_size),
+            )
+            for sink_type, sink in sinks.items()
+        }
+
+
+@dataclasses.dataclass
+class DeliveryFailure:
+    sink_type: str
+    targets: typing.Sequence[str]
+    error: Exception
+
+
+@dataclasses.dataclass
+class DispatchError(Exception):
+    alarm_arn: str
+    failures: typing.List[DeliveryFailure]
+
+    def __str__(self) -> str:
+        return f"dispatch alarm notification failed [alarm_arn: {self.alarm_arn}, failures: {', '.join(f'{failure.sink_type}: {failure.error}' for failure in self.failures)}]"
+
+
+class Dispatcher:
+    def __init__(self, sinks: typing.Dict[str, Sink], max_workers: int = 8):
+        self._sinks = sinks
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def _deliver(
+        self, sink: Sink, notification: Notification, targets: typing.Sequence[str]
+    ) -> None:
+        for attempt in range(1, sink.policy.max_attempts + 1):
+            sink.rate_limiter.wait()
+
+            try:
+                sink.send(notification, targets)
+            except Exception as e:
+                if attempt == sink.policy.max_attempts or not sink.is_transient(e):
+                    raise
+
+                logger.warning(
+                    "delivering alarm notification failed, retrying",
+                    exc_info=True,
+                    extra={"sink": type(sink).__name__, "attempt": attempt},
+                )
+
+                time.sleep(sink.policy.backoff_seconds * 2 ** (attempt - 1))
+            else:
+                return
+
+    def dispatch(
+        self,
+        notification: Notification,
+        routes: typing.Iterable[typing.Tuple[str, str]],
+    ) -> None:
+        targets_by_sink_type: typing.Dict[str, typing.List[str]] = {}
+
+        for sink_type, target in routes:
+            targets_by_sink_type.setdefault(sink_type, []).append(target)
+
+        failures = []
+        futures = {}
+
+        for sink_type, targets in targets_by_sink_type.items():
+            sink = self._sinks.get(sink_type)
+
+            # failing the record would only redeliver to the other routes on
+            # every sqs retry
+            if sink is None:
+                logger.error(
+                    "unknown sink type, skipping its routes",
+                    extra={"sink_type": sink_type, "routes": len(targets)},
+                )
+
+                continue
+
+            for i in range(0, len(targets), sink.policy.max_batch_size):
+                batch = targets[i : i + sink.policy.max_batch_size]
+
+                futures[
+                    self._executor.submit(self._deliver, sink, notification, batch)
+                ] = (sink_type, batch)
+
+        for future in concurrent.futures.as_completed(futures):
+            sink_type, batch = futures[future]
+
+            try:
+                future.result()
+            except Exception as e:
+                failures.append(
+                    DeliveryFailure(sink_type=sink_type, targets=batch, error=e)
+                )
+
+        if failures:
+            raise DispatchError(alarm_arn=notification.alarm_arn, failures=failures)
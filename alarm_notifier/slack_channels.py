@@ -0,0 +1,148 @@
+import dataclasses
+import logging
+import threading
+import time
+import typing
+
+import slack_sdk
+import slack_sdk.http_retry.builtin_handlers
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_NAME_PREFIX = "#"
+
+
+@dataclasses.dataclass
+class UnknownSlackChannelError(Exception):
+    channel: str
+
+    def __str__(self) -> str:
+        return f"unknown slack channel '{self.channel}'"
+
+
+def is_channel_name(channel: str) -> bool:
+    return channel.startswith(CHANNEL_NAME_PREFIX)
+
+
+class SlackChannelIndex:
+    def __init__(
+        self,
+        client_factory: typing.Callable[[], slack_sdk.WebClient],
+        ttl_seconds: float = 3600,
+        min_refresh_interval_seconds: float = 60,
+    ):
+        self._client_factory = client_factory
+        self._ttl_seconds = ttl_seconds
+        self._min_refresh_interval_seconds = min_refresh_interval_seconds
+        self._lock = threading.Lock()
+        self._refresh_thread: typing.Optional[threading.Thread] = None
+        # channel name -> channel id, swapped as a whole on refresh
+        self._ids_by_name: typing.Optional[typing.Dict[str, str]] = None
+        self._refreshed_at = 0.0
+        # channel name -> when it was last missing from the index and triggered
+        # a refresh, it does not trigger another one before the ttl
+        self._missing_since: typing.Dict[str, float] = {}
+
+    def _list_channels(self) -> typing.Dict[str, str]:
+        slack_client = self._client_factory()
+        # conversations.list is a tier 2 method, large workspaces hit the rate limit
+        if not any(
+            isinstance(
+                handler,
+                slack_sdk.http_retry.builtin_handlers.RateLimitErrorRetryHandler,
+            )
+            for handler in slack_client.retry_handlers
+        ):
+            slack_client.retry_handlers.append(
+                slack_sdk.http_retry.builtin_handlers.RateLimitErrorRetryHandler(
+                    max_retry_count=10
+                )
+            )
+
+        ids_by_name = {}
+
+        for page in slack_client.conversations_list(
+            exclude_archived=True, limit=1000, types="public_channel,private_channel"
+        ):
+            for channel in page["channels"]:
+                ids_by_name[channel["name"]] = channel["id"]
+
+        return ids_by_name
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            if (
+                not force
+                and self._ids_by_name is not None
+                and time.monotonic() - self._refreshed_at
+                < self._min_refresh_interval_seconds
+            ):
+                return
+
+            logger.info("refreshing slack channel index")
+
+            self._ids_by_name = self._list_channels()
+            self._refreshed_at = time.monotonic()
+
+            logger.info(
+                "refreshed slack channel index",
+                extra={"channels": len(self._ids_by_name)},
+            )
+
+    def refresh_in_background(self) -> None:
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+
+        def refresh():
+            try:
+                self.refresh(force=True)
+            except Exception:
+                logger.warning("refreshing slack channel index failed", exc_info=True)
+
+        self._refresh_thread = threading.Thread(target=refresh, daemon=True)
+        self._refresh_thread.start()
+
+    def _index(self) -> typing.Dict[str, str]:
+        if self._ids_by_name is None:
+            self.refresh()
+        elif time.monotonic() - self._refreshed_at > self._ttl_seconds:
+            # keep serving the stale index while it is rebuilt
+            self.refresh_in_background()
+
+        return self._ids_by_name
+
+    def resolve(self, channel: str) -> str:
+        if not is_channel_name(channel):
+            return channel
+
+        name = channel[len(CHANNEL_NAME_PREFIX) :]
+
+        channel_id = self._index().get(name)
+
+        if channel_id is None:
+            self._refresh_for_missing(name)
+
+            raise UnknownSlackChannelError(channel)
+
+        return channel_id
+
+    def _refresh_for_missing(self, name: str) -> None:
+        # the channel may have been created since the last refresh, rebuilding
+        # a large index takes minutes under rate limits so records do not wait
+        with self._lock:
+            now = time.monotonic()
+            missing_since = self._missing_since.get(name)
+
+            if (
+                missing_since is not None and now - missing_since < self._ttl_seconds
+            ) or now - self._refreshed_at < self._min_refresh_interval_seconds:
+                return
+
+            self._missing_since[name] = now
+
+        logger.info("slack channel not in index, refreshing", extra={"name": name})
+
+        self.refresh_in_background()
+
+    def channel_ids(self) -> typing.Set[str]:
+        return set(self._index().values())
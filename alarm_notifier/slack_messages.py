@@ -0,0 +1,141 @@
+import concurrent.futures
+import datetime
+import logging
+import threading
+import typing
+
+import pynamodb.exceptions
+
+import alarm_notifier.models
+
+logger = logging.getLogger(__name__)
+
+UPDATE_MODE = "update"
+THREAD_MODE = "thread"
+
+
+class SlackMessageStore:
+    def __init__(self, ttl_seconds: float, max_workers: int = 8):
+        self._ttl = datetime.timedelta(seconds=ttl_seconds)
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        # alarm arn -> slack channel id -> ts, loaded once per sqs batch
+        self._timestamps: typing.Dict[str, typing.Dict[str, str]] = {}
+        # alarm arn -> slack channel id -> ts posted since the batch was loaded
+        self._dirty: typing.Dict[str, typing.Dict[str, str]] = {}
+
+    def prefetch(self, alarm_arns: typing.Iterable[str]) -> None:
+        alarm_arns = set(alarm_arns)
+
+        with self._lock:
+            self._timestamps = {alarm_arn: {} for alarm_arn in alarm_arns}
+            self._dirty = {}
+
+        if not alarm_arns:
+            return
+
+        logger.info("retrieving slack messages", extra={"alarm_arns": alarm_arns})
+
+        # batch_get issues one BatchGetItem per 100 keys
+        try:
+            models = list(
+                alarm_notifier.models.AlarmSlackMessageModel.batch_get(
+                    sorted(alarm_arns)
+                )
+            )
+        except Exception:
+            # without the timestamps later transitions are posted as new messages
+            logger.warning(
+                "retrieving slack messages failed",
+                exc_info=True,
+                extra={"alarm_arns": alarm_arns},
+            )
+
+            return
+
+        with self._lock:
+            for model in models:
+                self._timestamps[model.alarm_arn] = (
+                    model.message_timestamps.as_dict()
+                    if model.message_timestamps
+                    else {}
+                )
+
+    def get(self, alarm_arn: str, slack_channel_id: str) -> typing.Optional[str]:
+        with self._lock:
+            return self._timestamps.get(alarm_arn, {}).get(slack_channel_id)
+
+    def put(self, alarm_arn: str, slack_channel_id: str, ts: str) -> None:
+        with self._lock:
+            self._timestamps.setdefault(alarm_arn, {})[slack_channel_id] = ts
+            self._dirty.setdefault(alarm_arn, {})[slack_channel_id] = ts
+
+    def _save(self, alarm_arn: str, message_timestamps: typing.Dict[str, str]) -> None:
+        model = alarm_notifier.models.AlarmSlackMessageModel(alarm_arn)
+        expiration = alarm_notifier.models.AlarmSlackMessageModel.expiration.set(
+            self._ttl
+        )
+        # only the channels posted to are set, invocations handling the same
+        # alarm concurrently keep each other's channels
+        channel_actions = [
+            alarm_notifier.models.AlarmSlackMessageModel.message_timestamps[
+                slack_channel_id
+            ].set(ts)
+            for slack_channel_id, ts in message_timestamps.items()
+        ]
+
+        try:
+            model.update(actions=channel_actions + [expiration])
+
+            return
+        except pynamodb.exceptions.UpdateError as e:
+            # the item and its map do not exist before the first alarm post
+            if e.cause_response_code != "ValidationException":
+                raise
+
+        try:
+            model.update(
+                actions=[
+                    alarm_notifier.models.AlarmSlackMessageModel.message_timestamps.set(
+                        message_timestamps
+                    ),
+                    expiration,
+                ],
+                condition=alarm_notifier.models.AlarmSlackMessageModel.message_timestamps.does_not_exist(),
+            )
+        except pynamodb.exceptions.UpdateError as e:
+            if e.cause_response_code != "ConditionalCheckFailedException":
+                raise
+
+            # another invocation created the map in the meantime
+            model.update(actions=channel_actions + [expiration])
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+
+        if not dirty:
+            return
+
+        logger.info("saving slack messages", extra={"alarm_arns": sorted(dirty)})
+
+        # one update per alarm for the whole sqs batch, issued concurrently
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(dirty), self._max_workers)
+        ) as executor:
+            futures = {
+                executor.submit(self._save, alarm_arn, message_timestamps): alarm_arn
+                for alarm_arn, message_timestamps in dirty.items()
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    # the notifications went out, later transitions of the
+                    # alarm post new messages
+                    logger.warning(
+                        "saving slack messages failed",
+                        exc_info=True,
+                        extra={"alarm_arn": futures[future]},
+                    )
@@ -0,0 +1,288 @@
+"""Benchmark the per record cost of the tracing modes and Sentry sampling.
+
+Usage::
+
+    python -m benchmarks.record_overhead --batch-size 10 --rounds 3
+
+Every configuration imports the lambda handler in its own process, with the
+Lambda environment variables the X-Ray SDK and Powertools Tracer look for and
+with Sentry's ``AwsLambdaIntegration`` wrapping the handler as the Lambda
+runtime would. Idempotency is disabled, routes are served from memory and
+notifications go to a sink that drops them, so what is left is parsing,
+rendering, logging and the tracing itself. X-Ray segments are sent to the
+daemon address as usual and Sentry events to a transport that discards them.
+
+Each configuration reports the fastest of many short timing windows, over
+rounds that interleave the configurations, so machine noise inflates the
+numbers less than it would a single long run.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# (label, RECORD_TRACING_MODE, SLOW_RECORD_THRESHOLD_MS, tracer enabled)
+TRACING_CONFIGS = [
+    ("disabled", "off", "1000", False),
+    ("off", "off", "1000", True),
+    ("slow", "slow", "1000", True),
+    ("slow, every record", "slow", "0", True),
+    ("all", "all", "1000", True),
+]
+
+# (label, dsn, SENTRY_TRACES_SAMPLE_RATE)
+SENTRY_CONFIGS = [
+    ("off", "", ""),
+    ("errors", "https://public@o0.ingest.sentry.io/0", ""),
+    ("traces", "https://public@o0.ingest.sentry.io/0", "1.0"),
+]
+
+
+class _LambdaContext:
+    function_name = "alarm-notifier-benchmark"
+    function_version = "$LATEST"
+    memory_limit_in_mb = 256
+    invoked_function_arn = (
+        "arn:aws:lambda:us-east-1:123456789012:function:alarm-notifier-benchmark"
+    )
+    aws_request_id = "00000000-0000-0000-0000-000000000000"
+    log_group_name = "/aws/lambda/alarm-notifier-benchmark"
+    log_stream_name = "benchmark"
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 60_000
+
+
+def _record(i: int) -> typing.Dict[str, typing.Any]:
+    alarm_arn = f"arn:aws:cloudwatch:us-east-1:123456789012:alarm:alarm-{i}"
+    event = {
+        "version": "0",
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "detail-type": "CloudWatch Alarm State Change",
+        "source": "aws.cloudwatch",
+        "account": "123456789012",
+        "time": "2024-01-01T00:00:00Z",
+        "region": "us-east-1",
+        "resources": [alarm_arn],
+        "detail": {
+            "alarmName": f"alarm-{i}",
+            "state": {"value": "ALARM", "reason": "Threshold Crossed"},
+        },
+    }
+    notification = {
+        "Type": "Notification",
+        "MessageId": f"message-{i}",
+        "TopicArn": "arn:aws:sns:us-east-1:123456789012:alarms",
+        "Message": json.dumps(event),
+        "Timestamp": "2024-01-01T00:00:00Z",
+        "SignatureVersion": "1",
+        "Signature": "signature",
+        "SigningCertURL": "https://sns.us-east-1.amazonaws.com/cert.pem",
+        "UnsubscribeURL": "https://sns.us-east-1.amazonaws.com/unsubscribe",
+    }
+
+    return {
+        "messageId": f"message-{i}",
+        "receiptHandle": "receipt-handle",
+        "body": json.dumps(notification),
+        "attributes": {
+            "ApproximateReceiveCount": "1",
+            "SentTimestamp": "1704067200000",
+            "SenderId": "sender",
+            "ApproximateFirstReceiveTimestamp": "1704067200000",
+        },
+        "messageAttributes": {},
+        "md5OfBody": "md5",
+        "eventSource": "aws:sqs",
+        "eventSourceARN": "arn:aws:sqs:us-east-1:123456789012:alarms",
+        "awsRegion": "us-east-1",
+    }
+
+
+def _measure(args: argparse.Namespace) -> float:
+    # imported here, the lambda handler configures everything at import time
+    import sentry_sdk
+    import sentry_sdk.integrations.aws_lambda
+    import sentry_sdk.transport
+    from aws_lambda_powertools.utilities import parameters
+
+    parameters.get_parameter = lambda name, *args, **kwargs: {
+        "sentry-dsn": os.environ["BENCHMARK_SENTRY_DSN"] or None,
+        "idempotency-table": "idempotency",
+    }.get(name)
+
+    class DiscardTransport(sentry_sdk.transport.Transport):
+        def capture_event(self, event: typing.Any) -> None:
+            pass
+
+        def capture_envelope(self, envelope: typing.Any) -> None:
+            pass
+
+    sentry_init = sentry_sdk.init
+    sentry_sdk.init = lambda *args, **kwargs: sentry_init(
+        *args, transport=DiscardTransport, **kwargs
+    )
+
+    import alarm_notifier.lambda_handler
+    import alarm_notifier.models
+    import alarm_notifier.sinks
+
+    alarm_notifier.lambda_handler.console_handler.setStream(
+        open(os.devnull, "w", encoding="utf-8")
+    )
+
+    class NullSink(alarm_notifier.sinks.Sink):
+        def send(self, notification, targets) -> None:
+            pass
+
+    alarm_notifier.lambda_handler.dispatcher = alarm_notifier.sinks.Dispatcher(
+        sinks={
+            alarm_notifier.sinks.SLACK_SINK_TYPE: NullSink(
+                policy=alarm_notifier.sinks.DeliveryPolicy()
+            )
+        }
+    )
+    alarm_notifier.models.AlarmSlackWebhookModel.query = classmethod(
+        lambda cls, alarm_arn, *args, **kwargs: iter(
+            [cls(alarm_arn=alarm_arn, slack_channel_id="C0000000000")]
+        )
+    )
+
+    # outside the lambda runtime the integration does not wrap the handler itself
+    handler = alarm_notifier.lambda_handler.handler
+
+    if os.environ["BENCHMARK_SENTRY_DSN"]:
+        handler = sentry_sdk.integrations.aws_lambda._wrap_handler(handler)
+
+    context = _LambdaContext()
+    event = {"Records": [_record(i) for i in range(args.batch_size)]}
+
+    for _ in range(args.warmup):
+        handler(event, context)
+
+    best = float("inf")
+
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+
+        for _ in range(args.invocations):
+            result = handler(event, context)
+
+        best = min(best, time.perf_counter() - started)
+
+        if result["batchItemFailures"]:
+            raise RuntimeError(f"records failed: {result['batchItemFailures']}")
+
+    return best / (args.invocations * args.batch_size)
+
+
+def _run(
+    args: argparse.Namespace,
+    tracing: typing.Tuple[str, str, str, bool],
+    sentry: typing.Tuple[str, str, str],
+) -> float:
+    _, tracing_mode, threshold_ms, tracer_enabled = tracing
+    _, dsn, traces_sample_rate = sentry
+
+    env = {
+        **os.environ,
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        # what the x-ray sdk and powertools tracer read to detect lambda
+        "AWS_LAMBDA_FUNCTION_NAME": _LambdaContext.function_name,
+        "LAMBDA_TASK_ROOT": tempfile.gettempdir(),
+        "_X_AMZN_TRACE_ID": (
+            "Root=1-5759e988-bd862e3fe1be46a994272793;"
+            "Parent=53995c3f42cd8ad8;Sampled=1"
+        ),
+        "POWERTOOLS_TRACE_DISABLED": "false" if tracer_enabled else "true",
+        "POWERTOOLS_IDEMPOTENCY_DISABLED": "true",
+        "IDEMPOTENCY_TABLE_NAME_SSM_PARAMETER_NAME": "idempotency-table",
+        "ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_NAME": "routes",
+        "SENTRY_DSN_SECRET_NAME": "sentry-dsn",
+        "SENTRY_TRACES_SAMPLE_RATE": traces_sample_rate,
+        "BENCHMARK_SENTRY_DSN": dsn,
+        "RECORD_TRACING_MODE": tracing_mode,
+        "SLOW_RECORD_THRESHOLD_MS": threshold_ms,
+    }
+
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.record_overhead",
+                "--batch-size",
+                str(args.batch_size),
+                "--invocations",
+                str(args.invocations),
+                "--repeats",
+                str(args.repeats),
+                "--warmup",
+                str(args.warmup),
+                "--output",
+                output.name,
+            ],
+            env=env,
+            check=True,
+            # the metrics are printed to stdout on every invocation
+            stdout=subprocess.DEVNULL,
+        )
+
+        with open(output.name, encoding="utf-8") as f:
+            return json.load(f)["seconds_per_record"]
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.record_overhead")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=25)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"seconds_per_record": _measure(args)}, f)
+
+        return
+
+    logging.basicConfig(level=logging.INFO)
+
+    results: typing.Dict[typing.Tuple[str, str], float] = {}
+
+    for i in range(args.rounds):
+        for tracing in TRACING_CONFIGS:
+            for sentry in SENTRY_CONFIGS:
+                results[tracing[0], sentry[0]] = min(
+                    results.get((tracing[0], sentry[0]), float("inf")),
+                    _run(args, tracing, sentry),
+                )
+
+        logger.info("measured round %d of %d", i + 1, args.rounds)
+
+    baseline = results[TRACING_CONFIGS[0][0], SENTRY_CONFIGS[0][0]]
+
+    print(f"{'tracing':<20} {'sentry':<8} {'us/record':>10} {'overhead':>10}")
+
+    for (tracing_label, sentry_label), seconds in results.items():
+        print(
+            f"{tracing_label:<20} {sentry_label:<8} {seconds * 1e6:>10.1f} "
+            f"{(seconds - baseline) * 1e6:>+10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
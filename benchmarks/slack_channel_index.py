@@ -0,0 +1,284 @@
+"""Benchmark the Slack channel index against a local fake of the Slack Web API.
+
+Usage::
+
+    python -m benchmarks.slack_channel_index --channels 50000 --requests-per-minute 20
+
+The fake runs in its own process and serves ``conversations.list`` over HTTP
+with cursor pagination and channel objects shaped like Slack's. It answers
+``429`` with ``Retry-After`` once a tier 2 style token bucket is exhausted,
+``--requests-per-minute 0`` disables the rate limit.
+"""
+
+import argparse
+import http.server
+import json
+import logging
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import typing
+import urllib.parse
+
+import slack_sdk
+
+import alarm_notifier.slack_channels
+
+logger = logging.getLogger(__name__)
+
+
+def _channel(i: int) -> typing.Dict[str, typing.Any]:
+    name = f"channel-{i:06d}"
+
+    return {
+        "id": f"C{i:010d}",
+        "name": name,
+        "is_channel": True,
+        "is_group": False,
+        "is_im": False,
+        "is_mpim": False,
+        "is_private": False,
+        "created": 1600000000 + i,
+        "is_archived": False,
+        "is_general": i == 0,
+        "unlinked": 0,
+        "name_normalized": name,
+        "is_shared": False,
+        "is_org_shared": False,
+        "is_pending_ext_shared": False,
+        "pending_shared": [],
+        "context_team_id": "T0000000000",
+        "updated": 1600000000000 + i,
+        "parent_conversation": None,
+        "creator": "U0000000000",
+        "is_ext_shared": False,
+        "shared_team_ids": ["T0000000000"],
+        "pending_connected_team_ids": [],
+        "is_member": False,
+        "topic": {"value": f"Topic of {name}", "creator": "", "last_set": 0},
+        "purpose": {"value": f"Purpose of {name}", "creator": "", "last_set": 0},
+        "previous_names": [],
+        "num_members": 10,
+    }
+
+
+class FakeSlack:
+    def __init__(
+        self,
+        channels: int,
+        requests_per_minute: float,
+        burst: int,
+        requests: multiprocessing.Value,
+        rate_limited: multiprocessing.Value,
+    ):
+        self.channels = [_channel(i) for i in range(channels)]
+        self.requests = requests
+        self.rate_limited = rate_limited
+        self._refill_per_second = requests_per_minute / 60
+        self._burst = burst
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take_token(self) -> typing.Optional[int]:
+        """Returns None when the request may proceed, otherwise its Retry-After."""
+        with self._lock:
+            with self.requests.get_lock():
+                self.requests.value += 1
+
+            if not self._refill_per_second:
+                return None
+
+            now = time.monotonic()
+            self._tokens = min(
+                self._burst,
+                self._tokens + (now - self._refilled_at) * self._refill_per_second,
+            )
+            self._refilled_at = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+
+                return None
+
+            with self.rate_limited.get_lock():
+                self.rate_limited.value += 1
+
+            return math.ceil((1 - self._tokens) / self._refill_per_second)
+
+    def conversations_list(
+        self, params: typing.Dict[str, str]
+    ) -> typing.Dict[str, typing.Any]:
+        offset = int(params.get("cursor") or 0)
+        limit = min(int(params.get("limit", 100)), 1000)
+
+        page = self.channels[offset : offset + limit]
+        next_offset = offset + len(page)
+
+        return {
+            "ok": True,
+            "channels": page,
+            "response_metadata": {
+                "next_cursor": str(next_offset)
+                if next_offset < len(self.channels)
+                else ""
+            },
+        }
+
+
+def _handler(fake_slack: FakeSlack) -> typing.Type[http.server.BaseHTTPRequestHandler]:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _respond(self, params: typing.Dict[str, str]) -> None:
+            retry_after = fake_slack.take_token()
+
+            if retry_after is not None:
+                body = json.dumps({"ok": False, "error": "ratelimited"}).encode()
+
+                self.send_response(429)
+                self.send_header("Retry-After", str(retry_after))
+            elif urllib.parse.urlsplit(self.path).path.endswith("/conversations.list"):
+                body = json.dumps(fake_slack.conversations_list(params)).encode()
+
+                self.send_response(200)
+            else:
+                body = json.dumps({"ok": False, "error": "unknown_method"}).encode()
+
+                self.send_response(404)
+
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._respond(
+                dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+            )
+
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            self._respond(dict(urllib.parse.parse_qsl(body.decode())))
+
+        def log_message(self, format: str, *args: typing.Any) -> None:
+            pass
+
+    return Handler
+
+
+def _serve(
+    fake_slack_kwargs: typing.Dict[str, typing.Any],
+    port: multiprocessing.Value,
+    ready: multiprocessing.Event,
+) -> None:
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), _handler(FakeSlack(**fake_slack_kwargs))
+    )
+
+    port.value = server.server_address[1]
+    ready.set()
+
+    server.serve_forever()
+
+
+def _index_bytes(ids_by_name: typing.Dict[str, str]) -> int:
+    return sys.getsizeof(ids_by_name) + sum(
+        sys.getsizeof(name) + sys.getsizeof(channel_id)
+        for name, channel_id in ids_by_name.items()
+    )
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.slack_channel_index")
+    parser.add_argument("--channels", default=50000, type=int)
+    parser.add_argument(
+        "--requests-per-minute",
+        default=20,
+        type=float,
+        help="conversations.list rate limit, slack's tier 2 is 20+ per minute",
+    )
+    parser.add_argument("--burst", default=20, type=int)
+    parser.add_argument("--lookups", default=100000, type=int)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    requests = multiprocessing.Value("i", 0)
+    rate_limited = multiprocessing.Value("i", 0)
+    port = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Event()
+
+    # a separate process keeps the fake's json encoding off the client's gil
+    server = multiprocessing.Process(
+        target=_serve,
+        args=(
+            {
+                "channels": args.channels,
+                "requests_per_minute": args.requests_per_minute,
+                "burst": args.burst,
+                "requests": requests,
+                "rate_limited": rate_limited,
+            },
+            port,
+            ready,
+        ),
+        daemon=True,
+    )
+    server.start()
+    ready.wait()
+
+    slack_client = slack_sdk.WebClient(
+        token="xoxb-benchmark", base_url=f"http://127.0.0.1:{port.value}/api/"
+    )
+
+    slack_channel_index = alarm_notifier.slack_channels.SlackChannelIndex(
+        client_factory=lambda: slack_client
+    )
+
+    names = [f"#{_channel(i)['name']}" for i in range(args.channels)]
+
+    started = time.perf_counter()
+
+    # the first name builds the index, as on the first route of a cold start
+    slack_channel_index.resolve(names[0])
+
+    build_seconds = time.perf_counter() - started
+    build_requests = requests.value
+
+    lookups = random.choices(names, k=args.lookups)
+
+    started = time.perf_counter()
+
+    for name in lookups:
+        slack_channel_index.resolve(name)
+
+    lookup_seconds = time.perf_counter() - started
+
+    server.terminate()
+
+    print(
+        json.dumps(
+            {
+                "channels": args.channels,
+                "requests_per_minute": args.requests_per_minute,
+                "build_seconds": round(build_seconds, 3),
+                "build_requests": build_requests,
+                "build_rate_limited": rate_limited.value,
+                "index_megabytes": round(
+                    _index_bytes(slack_channel_index._ids_by_name) / 1024 / 1024, 2
+                ),
+                "lookups": args.lookups,
+                "lookup_microseconds": round(lookup_seconds / args.lookups * 1e6, 3),
+                "lookup_requests": requests.value - build_requests,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
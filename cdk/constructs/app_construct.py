@@ -1,3 +1,6 @@
+import dataclasses
+import typing
+
 import aws_cdk
 import cdk_nag
 import constructs
@@ -15,10 +18,55 @@ from aws_cdk import (
     aws_lambda_event_sources,
     aws_ecr_assets,
     aws_secretsmanager,
+    aws_events,
+    aws_events_targets,
 )
 from tbg_cdk import tbg_constructs
 
 
+@dataclasses.dataclass(frozen=True)
+class IngestionShard:
+    account_ids: typing.Sequence[str]
+    max_concurrency: int = 2
+
+
+@dataclasses.dataclass
+class InvalidIngestionShardsError(Exception):
+    # accounts without a bus policy would have their events rejected
+    unknown_account_ids: typing.List[str]
+    # accounts matched by several shard rules would be notified more than once
+    duplicate_account_ids: typing.List[str]
+
+    def __str__(self) -> str:
+        return f"invalid ingestion shards [unknown_account_ids: {', '.join(self.unknown_account_ids)}, duplicate_account_ids: {', '.join(self.duplicate_account_ids)}]"
+
+
+def _validate_ingestion_shards(
+    ingestion_shards: typing.Sequence[IngestionShard],
+    source_account_ids: typing.Sequence[str],
+) -> None:
+    sharded_account_ids = [
+        account_id
+        for ingestion_shard in ingestion_shards
+        for account_id in ingestion_shard.account_ids
+    ]
+
+    unknown_account_ids = sorted(set(sharded_account_ids) - set(source_account_ids))
+    duplicate_account_ids = sorted(
+        {
+            account_id
+            for account_id in sharded_account_ids
+            if sharded_account_ids.count(account_id) > 1
+        }
+    )
+
+    if unknown_account_ids or duplicate_account_ids:
+        raise InvalidIngestionShardsError(
+            unknown_account_ids=unknown_account_ids,
+            duplicate_account_ids=duplicate_account_ids,
+        )
+
+
 class AppConstruct(constructs.Construct):
     def __init__(
         self,
@@ -31,22 +79,72 @@ class AppConstruct(constructs.Construct):
         sentry_dsn_secret_name: str,
         slack_alarm_notifier_oauth_token_secret_name: str,
         vpc: aws_ec2.IVpc,
+        enable_vpc_endpoints: bool = False,
+        enable_dynamodb_gateway_endpoint: bool = False,
+        enable_alarm_context_enrichment: bool = False,
+        notification_email_sender: typing.Optional[str] = None,
+        source_account_ids: typing.Sequence[str] = (),
+        ingestion_shards: typing.Sequence[IngestionShard] = (),
+        slack_message_update_mode: typing.Optional[str] = None,
+        sentry_error_sample_rate: typing.Optional[float] = None,
+        sentry_traces_sample_rate: typing.Optional[float] = None,
+        record_tracing_mode: typing.Optional[str] = None,
+        slow_record_threshold_ms: typing.Optional[int] = None,
     ):
         super().__init__(scope=scope, id=id)
 
+        _validate_ingestion_shards(
+            ingestion_shards=ingestion_shards, source_account_ids=source_account_ids
+        )
+
         self._create_role_and_managed_policy(namer=namer)
         self._create_kms_key(namer=namer)
         self._create_dead_letter_queue(namer=namer)
         self._create_function_security_group(namer=namer, vpc=vpc)
         self._create_function_idempotency_table(namer=namer)
         self._create_function_data_table(namer=namer)
+
+        if slack_message_update_mode:
+            self._create_function_slack_messages_table(namer=namer)
         self._create_function_parameters_and_secrets(
             namer=namer,
             sentry_env=sentry_env,
             sentry_dsn_secret_name=sentry_dsn_secret_name,
             slack_alarm_notifier_oauth_token_secret_name=slack_alarm_notifier_oauth_token_secret_name,
         )
-        self._create_function(alarm_notifier_code=alarm_notifier_code, namer=namer, vpc=vpc)
+        self._create_function(
+            alarm_notifier_code=alarm_notifier_code,
+            enable_alarm_context_enrichment=enable_alarm_context_enrichment,
+            namer=namer,
+            notification_email_sender=notification_email_sender,
+            slack_message_update_mode=slack_message_update_mode,
+            sentry_error_sample_rate=sentry_error_sample_rate,
+            sentry_traces_sample_rate=sentry_traces_sample_rate,
+            record_tracing_mode=record_tracing_mode,
+            slow_record_threshold_ms=slow_record_threshold_ms,
+            vpc=vpc,
+        )
+
+        self.ingestion_shards = []
+
+        if source_account_ids:
+            self._create_cross_account_ingestion(
+                alarm_notifier_code=alarm_notifier_code,
+                ingestion_shards=ingestion_shards,
+                namer=namer,
+                source_account_ids=source_account_ids,
+                vpc=vpc,
+            )
+
+        if enable_dynamodb_gateway_endpoint:
+            self._create_dynamodb_gateway_endpoint(vpc=vpc)
+
+        if enable_vpc_endpoints:
+            self._create_vpc_endpoints(
+                enable_alarm_context_enrichment=enable_alarm_context_enrichment,
+                namer=namer,
+                vpc=vpc,
+            )
 
     def _create_role_and_managed_policy(self, namer: tbg_cdk.IResourceNamer) -> None:
         self.alarm_notifier_role = aws_iam.Role(
@@ -182,6 +280,43 @@ class AppConstruct(constructs.Construct):
             self.alarm_notifier_function_execution_managed_policy
         )
 
+    def _create_function_slack_messages_table(
+        self, namer: tbg_cdk.IResourceNamer
+    ) -> None:
+        self.alarm_notification_slack_messages_table = aws_dynamodb.Table(
+            scope=self,
+            id="AlarmSlackMessagesTable",
+            table_name=namer.get_name("AlarmSlackMessagesTable"),
+            partition_key=aws_dynamodb.Attribute(
+                name="AlarmArn", type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=aws_dynamodb.TableEncryption.CUSTOMER_MANAGED,
+            encryption_key=self.key_alias,
+            time_to_live_attribute="expiration",
+            point_in_time_recovery=True,
+        )
+
+        self.alarm_notification_slack_messages_table.grant_read_write_data(
+            self.alarm_notifier_function_execution_managed_policy
+        )
+
+        self.alarm_notification_slack_messages_table_name_parameter = (
+            aws_ssm.StringParameter(
+                scope=self,
+                id="AlarmSlackMessagesTableNameParameter",
+                description="Name of the alarm slack messages DynamoDB table.",
+                parameter_name=namer.get_parameter_name(
+                    "AlarmSlackMessagesTableNameSsmParameter"
+                ),
+                string_value=self.alarm_notification_slack_messages_table.table_name,
+            )
+        )
+
+        self.alarm_notification_slack_messages_table_name_parameter.grant_read(
+            self.alarm_notifier_function_execution_managed_policy
+        )
+
     def _create_function_parameters_and_secrets(
         self,
         namer: tbg_cdk.IResourceNamer,
@@ -258,11 +393,119 @@ class AppConstruct(constructs.Construct):
         )
 
     def _create_function(
-        self, alarm_notifier_code: aws_lambda.Code, namer: tbg_cdk.IResourceNamer, vpc: aws_ec2.IVpc
+        self,
+        alarm_notifier_code: aws_lambda.Code,
+        enable_alarm_context_enrichment: bool,
+        namer: tbg_cdk.IResourceNamer,
+        notification_email_sender: typing.Optional[str],
+        slack_message_update_mode: typing.Optional[str],
+        sentry_error_sample_rate: typing.Optional[float],
+        sentry_traces_sample_rate: typing.Optional[float],
+        record_tracing_mode: typing.Optional[str],
+        slow_record_threshold_ms: typing.Optional[int],
+        vpc: aws_ec2.IVpc,
     ) -> None:
-        self.alarm_notifier = tbg_constructs.TopicQueueFunction(
-            scope=self,
+        environment = {
+            "IDEMPOTENCY_TABLE_NAME_SSM_PARAMETER_NAME": self.alarm_notification_idempotency_table_name_parameter.parameter_name,
+            "ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_SSM_PARAMETER_NAME": self.alarm_notification_slack_channels_table_name_parameter.parameter_name,
+            "SENTRY_DSN_SECRET_NAME": self.alarm_notification_sentry_dsn_secret.secret_name,
+            "SENTRY_ENV_SSM_PARAMETER_NAME": self.alarm_notification_sentry_env_parameter.parameter_name,
+            "SLACK_OAUTH_TOKEN_SECRET_NAME": self.alarm_notification_slack_oauth_secret.secret_name,
+            "ALARM_CONTEXT_ENRICHMENT_ENABLED": str(
+                enable_alarm_context_enrichment
+            ).lower(),
+        }
+
+        if enable_alarm_context_enrichment:
+            # only alarms of this account can be described
+            environment["ALARM_CONTEXT_ACCOUNT_ID"] = aws_cdk.Aws.ACCOUNT_ID
+
+        if notification_email_sender:
+            environment["SES_SENDER_ADDRESS"] = notification_email_sender
+
+        if slack_message_update_mode:
+            environment["SLACK_MESSAGE_UPDATE_MODE"] = slack_message_update_mode
+            environment[
+                "ALARM_SLACK_MESSAGES_DYNAMODB_TABLE_SSM_PARAMETER_NAME"
+            ] = (
+                self.alarm_notification_slack_messages_table_name_parameter.parameter_name
+            )
+
+        for name, value in {
+            "SENTRY_ERROR_SAMPLE_RATE": sentry_error_sample_rate,
+            "SENTRY_TRACES_SAMPLE_RATE": sentry_traces_sample_rate,
+            "RECORD_TRACING_MODE": record_tracing_mode,
+            "SLOW_RECORD_THRESHOLD_MS": slow_record_threshold_ms,
+        }.items():
+            if value is not None:
+                environment[name] = str(value)
+
+        self.alarm_notifier_function_environment = environment
+
+        self.alarm_notifier = self._create_topic_queue_function(
             id="AlarmNotifier",
+            alarm_notifier_code=alarm_notifier_code,
+            namer=namer,
+            shard_name="Default",
+            vpc=vpc,
+        )
+
+        if enable_alarm_context_enrichment:
+            self.alarm_notifier_function_execution_managed_policy.add_statements(
+                aws_iam.PolicyStatement(
+                    actions=["cloudwatch:DescribeAlarms"],
+                    effect=aws_iam.Effect.ALLOW,
+                    resources=["*"],
+                )
+            )
+
+            cdk_nag.NagSuppressions.add_resource_suppressions(
+                construct=self.alarm_notifier_function_execution_managed_policy,
+                suppressions=[
+                    cdk_nag.NagPackSuppression(
+                        id="AwsSolutions-IAM5",
+                        reason="cloudwatch:DescribeAlarms does not support resource-level permissions.",
+                        applies_to=["Resource::*"],
+                    )
+                ],
+            )
+
+        if notification_email_sender:
+            self.alarm_notifier_function_execution_managed_policy.add_statements(
+                aws_iam.PolicyStatement(
+                    actions=["ses:SendEmail"],
+                    effect=aws_iam.Effect.ALLOW,
+                    resources=[
+                        f"arn:{aws_cdk.Aws.PARTITION}:ses:{aws_cdk.Aws.REGION}:{aws_cdk.Aws.ACCOUNT_ID}:identity/*"
+                    ],
+                )
+            )
+
+            cdk_nag.NagSuppressions.add_resource_suppressions(
+                construct=self.alarm_notifier_function_execution_managed_policy,
+                suppressions=[
+                    cdk_nag.NagPackSuppression(
+                        id="AwsSolutions-IAM5",
+                        reason="SES authorizes the sender and every recipient identity, which are only known at runtime.",
+                        applies_to=[
+                            "Resource::arn:<AWS::Partition>:ses:<AWS::Region>:<AWS::AccountId>:identity/*"
+                        ],
+                    )
+                ],
+            )
+
+    def _create_topic_queue_function(
+        self,
+        id: str,
+        alarm_notifier_code: aws_lambda.Code,
+        namer: tbg_cdk.IResourceNamer,
+        shard_name: str,
+        vpc: aws_ec2.IVpc,
+        max_concurrency: typing.Optional[int] = None,
+    ) -> tbg_constructs.TopicQueueFunction:
+        topic_queue_function = tbg_constructs.TopicQueueFunction(
+            scope=self,
+            id=id,
             function_props=aws_lambda.FunctionProps(
                 code=alarm_notifier_code,
                 handler="alarm_notifier.lambda_handler.handler",
@@ -271,11 +514,8 @@ class AppConstruct(constructs.Construct):
                 description="Sends CloudWatch Alarm notification to Slack channels.",
                 environment_encryption=self.key,
                 environment={
-                    "IDEMPOTENCY_TABLE_NAME_SSM_PARAMETER_NAME": self.alarm_notification_idempotency_table_name_parameter.parameter_name,
-                    "ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_SSM_PARAMETER_NAME": self.alarm_notification_slack_channels_table_name_parameter.parameter_name,
-                    "SENTRY_DSN_SECRET_NAME": self.alarm_notification_sentry_dsn_secret.secret_name,
-                    "SENTRY_ENV_SSM_PARAMETER_NAME": self.alarm_notification_sentry_env_parameter.parameter_name,
-                    "SLACK_OAUTH_TOKEN_SECRET_NAME": self.alarm_notification_slack_oauth_secret.secret_name,
+                    **self.alarm_notifier_function_environment,
+                    "SHARD_NAME": shard_name,
                 },
                 function_name=namer.get_name("Function"),
                 insights_version=aws_lambda.LambdaInsightsVersion.VERSION_1_0_229_0,
@@ -307,12 +547,12 @@ class AppConstruct(constructs.Construct):
                 managed_policy_name=namer.get_name("LogGroupManagedPolicy"),
             ),
             sqs_event_source_props=aws_lambda_event_sources.SqsEventSourceProps(
-                report_batch_item_failures=True
+                max_concurrency=max_concurrency, report_batch_item_failures=True
             ),
         )
 
         cdk_nag.NagSuppressions.add_resource_suppressions(
-            construct=self.alarm_notifier.fn,
+            construct=topic_queue_function.fn,
             suppressions=[
                 cdk_nag.NagPackSuppression(
                     id="AwsSolutions-L1",
@@ -321,6 +561,194 @@ class AppConstruct(constructs.Construct):
             ],
         )
 
-        self.alarm_notifier.queue.grant_consume_messages(
+        topic_queue_function.queue.grant_consume_messages(
             self.alarm_notifier_function_execution_managed_policy
         )
+
+        return topic_queue_function
+
+    def _create_cross_account_ingestion(
+        self,
+        alarm_notifier_code: aws_lambda.Code,
+        ingestion_shards: typing.Sequence[IngestionShard],
+        namer: tbg_cdk.IResourceNamer,
+        source_account_ids: typing.Sequence[str],
+        vpc: aws_ec2.IVpc,
+    ) -> None:
+        self.ingestion_event_bus = aws_events.EventBus(
+            scope=self,
+            id="IngestionEventBus",
+            event_bus_name=namer.get_name("IngestionEventBus"),
+        )
+
+        for source_account_id in source_account_ids:
+            aws_events.CfnEventBusPolicy(
+                scope=self,
+                id=f"IngestionEventBusPolicy{source_account_id}",
+                action="events:PutEvents",
+                event_bus_name=self.ingestion_event_bus.event_bus_name,
+                principal=source_account_id,
+                statement_id=f"AllowPutEventsFrom{source_account_id}",
+            )
+
+        self.key_alias.grant_encrypt_decrypt(
+            aws_iam.ServicePrincipal("events.amazonaws.com")
+        )
+
+        # each shard gets its own topic, queue and function so a noisy account
+        # only exhausts its own concurrency, accounts without a shard use the
+        # default topic
+        self.ingestion_shards = [
+            self._create_topic_queue_function(
+                id=f"AlarmNotifierShard{i}",
+                alarm_notifier_code=alarm_notifier_code,
+                max_concurrency=ingestion_shard.max_concurrency,
+                namer=namer.with_prefix(f"Shard{i}"),
+                shard_name=f"Shard{i}",
+                vpc=vpc,
+            )
+            for i, ingestion_shard in enumerate(ingestion_shards)
+        ]
+
+        for i, (ingestion_shard, topic_queue_function) in enumerate(
+            zip(ingestion_shards, self.ingestion_shards)
+        ):
+            aws_events.Rule(
+                scope=self,
+                id=f"IngestionShard{i}Rule",
+                description=f"Routes alarm state changes of shard {i} accounts.",
+                event_bus=self.ingestion_event_bus,
+                event_pattern=aws_events.EventPattern(
+                    account=list(ingestion_shard.account_ids),
+                    detail_type=["CloudWatch Alarm State Change"],
+                    source=["aws.cloudwatch"],
+                ),
+                rule_name=namer.get_name(f"IngestionShard{i}Rule"),
+                targets=[aws_events_targets.SnsTopic(topic_queue_function.topic)],
+            )
+
+        sharded_account_ids = [
+            account_id
+            for ingestion_shard in ingestion_shards
+            for account_id in ingestion_shard.account_ids
+        ]
+
+        aws_events.Rule(
+            scope=self,
+            id="IngestionDefaultRule",
+            description="Routes alarm state changes of accounts without a shard.",
+            event_bus=self.ingestion_event_bus,
+            event_pattern=aws_events.EventPattern(
+                account=aws_events.Match.anything_but(*sharded_account_ids)
+                if sharded_account_ids
+                else None,
+                detail_type=["CloudWatch Alarm State Change"],
+                source=["aws.cloudwatch"],
+            ),
+            rule_name=namer.get_name("IngestionDefaultRule"),
+            targets=[aws_events_targets.SnsTopic(self.alarm_notifier.topic)],
+        )
+
+    def _create_dynamodb_gateway_endpoint(self, vpc: aws_ec2.IVpc) -> None:
+        # routes dynamodb traffic of every workload in the subnets through the
+        # endpoint, and fails to deploy if their route tables already have one
+        self.dynamodb_gateway_endpoint = vpc.add_gateway_endpoint(
+            id="DynamoDbGatewayEndpoint",
+            service=aws_ec2.GatewayVpcEndpointAwsService.DYNAMODB,
+            subnets=[
+                aws_ec2.SubnetSelection(
+                    subnet_type=aws_ec2.SubnetType.PRIVATE_WITH_EGRESS
+                )
+            ],
+        )
+
+    def _create_vpc_endpoints(
+        self,
+        enable_alarm_context_enrichment: bool,
+        namer: tbg_cdk.IResourceNamer,
+        vpc: aws_ec2.IVpc,
+    ) -> None:
+        subnets = aws_ec2.SubnetSelection(
+            subnet_type=aws_ec2.SubnetType.PRIVATE_WITH_EGRESS
+        )
+
+        self.vpc_endpoint_security_group = aws_ec2.SecurityGroup(
+            scope=self,
+            id="VpcEndpointSecurityGroup",
+            allow_all_outbound=False,
+            description="Alarm notification function VPC interface endpoints security group.",
+            security_group_name=namer.get_name("VpcEndpointSecurityGroup"),
+            vpc=vpc,
+        )
+
+        self.vpc_endpoint_security_group.add_ingress_rule(
+            peer=self.alarm_notification_function_security_group,
+            connection=aws_ec2.Port.tcp(443),
+            description="HTTPS from the alarm notification function.",
+        )
+
+        # endpoint id -> (service, environment variable pointing the function at it)
+        interface_endpoint_services = {
+            "SsmInterfaceEndpoint": (
+                aws_ec2.InterfaceVpcEndpointAwsService.SSM,
+                "AWS_ENDPOINT_URL_SSM",
+            ),
+            "SecretsManagerInterfaceEndpoint": (
+                aws_ec2.InterfaceVpcEndpointAwsService.SECRETS_MANAGER,
+                "AWS_ENDPOINT_URL_SECRETS_MANAGER",
+            ),
+            "KmsInterfaceEndpoint": (
+                aws_ec2.InterfaceVpcEndpointAwsService.KMS,
+                "AWS_ENDPOINT_URL_KMS",
+            ),
+            "SqsInterfaceEndpoint": (
+                aws_ec2.InterfaceVpcEndpointAwsService.SQS,
+                "AWS_ENDPOINT_URL_SQS",
+            ),
+            "XRayInterfaceEndpoint": (
+                aws_ec2.InterfaceVpcEndpointAwsService.XRAY,
+                "AWS_ENDPOINT_URL_XRAY",
+            ),
+        }
+
+        if enable_alarm_context_enrichment:
+            # describe alarms clients are per region, only the function's own
+            # region may use the endpoint
+            interface_endpoint_services["CloudWatchMonitoringInterfaceEndpoint"] = (
+                aws_ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_MONITORING,
+                "CLOUDWATCH_ENDPOINT_URL",
+            )
+
+        self.interface_endpoints = {}
+
+        for endpoint_id, (
+            service,
+            endpoint_url_environment_variable,
+        ) in interface_endpoint_services.items():
+            # the vpc is shared, private dns would send every workload in it to
+            # these endpoints, only the function is pointed at them
+            self.interface_endpoints[endpoint_id] = vpc.add_interface_endpoint(
+                id=endpoint_id,
+                service=service,
+                open=False,
+                private_dns_enabled=False,
+                security_groups=[self.vpc_endpoint_security_group],
+                subnets=subnets,
+            )
+
+            # the first dns entry is the regional name of the endpoint
+            endpoint_url = "https://" + aws_cdk.Fn.select(
+                1,
+                aws_cdk.Fn.split(
+                    ":",
+                    aws_cdk.Fn.select(
+                        0,
+                        self.interface_endpoints[endpoint_id].vpc_endpoint_dns_entries,
+                    ),
+                ),
+            )
+
+            for topic_queue_function in [self.alarm_notifier, *self.ingestion_shards]:
+                topic_queue_function.fn.add_environment(
+                    key=endpoint_url_environment_variable, value=endpoint_url
+                )
@@ -1,3 +1,5 @@
+import typing
+
 import aws_cdk
 import constructs
 import tbg_cdk
@@ -17,6 +19,19 @@ class ApplicationStack(aws_cdk.Stack):
         sentry_dsn_secret_name: str,
         sentry_env: str,
         slack_alarm_notifier_oauth_token_secret_name: str,
+        enable_vpc_endpoints: bool = False,
+        enable_dynamodb_gateway_endpoint: bool = False,
+        enable_alarm_context_enrichment: bool = False,
+        notification_email_sender: typing.Optional[str] = None,
+        source_account_ids: typing.Sequence[str] = (),
+        ingestion_shards: typing.Sequence[
+            cdk.constructs.app_construct.IngestionShard
+        ] = (),
+        slack_message_update_mode: typing.Optional[str] = None,
+        sentry_error_sample_rate: typing.Optional[float] = None,
+        sentry_traces_sample_rate: typing.Optional[float] = None,
+        record_tracing_mode: typing.Optional[str] = None,
+        slow_record_threshold_ms: typing.Optional[int] = None,
         **kwargs
     ):
         super().__init__(scope=scope, id=id, **kwargs)
@@ -34,4 +49,15 @@ class ApplicationStack(aws_cdk.Stack):
             sentry_env=sentry_env,
             slack_alarm_notifier_oauth_token_secret_name=slack_alarm_notifier_oauth_token_secret_name,
             vpc=vpc,
+            enable_vpc_endpoints=enable_vpc_endpoints,
+            enable_dynamodb_gateway_endpoint=enable_dynamodb_gateway_endpoint,
+            enable_alarm_context_enrichment=enable_alarm_context_enrichment,
+            notification_email_sender=notification_email_sender,
+            source_account_ids=source_account_ids,
+            ingestion_shards=ingestion_shards,
+            slack_message_update_mode=slack_message_update_mode,
+            sentry_error_sample_rate=sentry_error_sample_rate,
+            sentry_traces_sample_rate=sentry_traces_sample_rate,
+            record_tracing_mode=record_tracing_mode,
+            slow_record_threshold_ms=slow_record_threshold_ms,
         )
@@ -0,0 +1,32 @@
+import os
+
+import boto3
+import moto
+import pytest
+
+# the models resolve their tables when imported, before any fixture runs
+os.environ.update(
+    AWS_DEFAULT_REGION="us-east-1",
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    ALARM_SLACK_CHANNELS_DYNAMODB_TABLE_NAME="AlarmSlackChannels",
+)
+os.environ.pop("DYNAMODB_ENDPOINT_URL", None)
+
+
+@pytest.fixture
+def routes_table():
+    import alarm_notifier.models
+
+    with moto.mock_dynamodb():
+        alarm_notifier.models.AlarmSlackWebhookModel.create_table(
+            billing_mode="PAY_PER_REQUEST", wait=True
+        )
+
+        yield alarm_notifier.models.AlarmSlackWebhookModel
+
+
+@pytest.fixture
+def sqs():
+    with moto.mock_sqs():
+        yield boto3.client("sqs")
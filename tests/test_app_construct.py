@@ -0,0 +1,294 @@
+import json
+
+import aws_cdk
+import pytest
+import tbg_cdk
+from aws_cdk import aws_ec2, aws_lambda
+from aws_cdk.assertions import Match, Template
+
+import cdk.constructs.app_construct
+
+
+def _synth(**kwargs) -> Template:
+    app = aws_cdk.App()
+
+    stack = aws_cdk.Stack(
+        scope=app,
+        id="Test",
+        env=aws_cdk.Environment(account="123456789012", region="us-east-1"),
+    )
+
+    cdk.constructs.app_construct.AppConstruct(
+        scope=stack,
+        id="App",
+        alarm_notifier_code=aws_lambda.Code.from_inline(
+            "def handler(event, context): ..."
+        ),
+        namer=tbg_cdk.ResourceNamer(["Test", "Prv", "UE1"]).with_prefix("App"),
+        sentry_dsn_secret_name="/Sentry/AlarmNotifier/Dsn",
+        sentry_env="test",
+        slack_alarm_notifier_oauth_token_secret_name="/Slack/AWSCloudWatchAlarmNotifier/BotUserOAuthToken",
+        vpc=aws_ec2.Vpc(scope=stack, id="Vpc"),
+        **kwargs,
+    )
+
+    return Template.from_stack(stack)
+
+
+def _logical_id(template: Template, type: str, props: dict) -> str:
+    resources = template.find_resources(type, {"Properties": props})
+
+    assert len(resources) == 1
+
+    return next(iter(resources))
+
+
+def _functions(template: Template) -> dict:
+    return template.find_resources(
+        "AWS::Lambda::Function",
+        {"Properties": {"Handler": "alarm_notifier.lambda_handler.handler"}},
+    )
+
+
+def test_vpc_endpoints_are_disabled_by_default():
+    template = _synth()
+
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 0)
+
+
+def test_dynamodb_gateway_endpoint():
+    # the gateway endpoint changes the shared vpc's route tables, it is only
+    # added when asked for explicitly
+    template = _synth(enable_vpc_endpoints=True)
+
+    assert not template.find_resources(
+        "AWS::EC2::VPCEndpoint", {"Properties": {"VpcEndpointType": "Gateway"}}
+    )
+
+    template = _synth(enable_dynamodb_gateway_endpoint=True)
+
+    gateway_endpoints = template.find_resources(
+        "AWS::EC2::VPCEndpoint", {"Properties": {"VpcEndpointType": "Gateway"}}
+    )
+
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 1)
+    assert ".dynamodb" in json.dumps(
+        next(iter(gateway_endpoints.values()))["Properties"]["ServiceName"]
+    )
+
+
+def test_vpc_endpoints():
+    template = _synth(enable_vpc_endpoints=True)
+
+    interface_endpoints = template.find_resources(
+        "AWS::EC2::VPCEndpoint", {"Properties": {"VpcEndpointType": "Interface"}}
+    )
+
+    assert sorted(
+        endpoint["Properties"]["ServiceName"].rsplit(".", 1)[-1]
+        for endpoint in interface_endpoints.values()
+    ) == ["kms", "secretsmanager", "sqs", "ssm", "xray"]
+
+    # the vpc is shared, the endpoints must not take over its dns
+    assert all(
+        endpoint["Properties"]["PrivateDnsEnabled"] is False
+        for endpoint in interface_endpoints.values()
+    )
+
+    function_security_group = _logical_id(
+        template,
+        "AWS::EC2::SecurityGroup",
+        {"GroupDescription": "Alarm notification function security group."},
+    )
+    endpoint_security_group = _logical_id(
+        template,
+        "AWS::EC2::SecurityGroup",
+        {
+            "GroupDescription": "Alarm notification function VPC interface endpoints security group."
+        },
+    )
+
+    template.has_resource_properties(
+        "AWS::EC2::SecurityGroupIngress",
+        {
+            "IpProtocol": "tcp",
+            "FromPort": 443,
+            "ToPort": 443,
+            "GroupId": {"Fn::GetAtt": [endpoint_security_group, "GroupId"]},
+            "SourceSecurityGroupId": {
+                "Fn::GetAtt": [function_security_group, "GroupId"]
+            },
+        },
+    )
+
+    assert all(
+        endpoint["Properties"]["SecurityGroupIds"]
+        == [{"Fn::GetAtt": [endpoint_security_group, "GroupId"]}]
+        for endpoint in interface_endpoints.values()
+    )
+
+    # the function reaches the services through the endpoints instead of the nat
+    for endpoint_id, environment_variable in {
+        "ssm": "AWS_ENDPOINT_URL_SSM",
+        "secretsmanager": "AWS_ENDPOINT_URL_SECRETS_MANAGER",
+        "kms": "AWS_ENDPOINT_URL_KMS",
+        "sqs": "AWS_ENDPOINT_URL_SQS",
+        "xray": "AWS_ENDPOINT_URL_XRAY",
+    }.items():
+        endpoint_logical_id = next(
+            logical_id
+            for logical_id, endpoint in interface_endpoints.items()
+            if endpoint["Properties"]["ServiceName"].endswith(f".{endpoint_id}")
+        )
+
+        for function in _functions(template).values():
+            endpoint_url = function["Properties"]["Environment"]["Variables"][
+                environment_variable
+            ]
+
+            assert json.dumps(
+                {"Fn::GetAtt": [endpoint_logical_id, "DnsEntries"]}
+            ) in json.dumps(endpoint_url)
+
+
+def test_vpc_endpoints_with_alarm_context_enrichment():
+    template = _synth(enable_vpc_endpoints=True, enable_alarm_context_enrichment=True)
+
+    template.has_resource_properties(
+        "AWS::EC2::VPCEndpoint",
+        {
+            "VpcEndpointType": "Interface",
+            "ServiceName": "com.amazonaws.us-east-1.monitoring",
+            "PrivateDnsEnabled": False,
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "alarm_notifier.lambda_handler.handler",
+            "Environment": {
+                "Variables": Match.object_like(
+                    {"CLOUDWATCH_ENDPOINT_URL": Match.any_value()}
+                )
+            },
+        },
+    )
+
+
+def test_ingestion_shards():
+    ingestion_shards = [
+        cdk.constructs.app_construct.IngestionShard(
+            account_ids=["111111111111"], max_concurrency=5
+        ),
+        cdk.constructs.app_construct.IngestionShard(
+            account_ids=["222222222222", "333333333333"]
+        ),
+        cdk.constructs.app_construct.IngestionShard(
+            account_ids=["444444444444"], max_concurrency=3
+        ),
+    ]
+
+    template = _synth(
+        source_account_ids=[
+            "111111111111",
+            "222222222222",
+            "333333333333",
+            "444444444444",
+            "555555555555",
+        ],
+        ingestion_shards=ingestion_shards,
+    )
+
+    template.resource_count_is("AWS::Events::EventBus", 1)
+    template.resource_count_is("AWS::Events::EventBusPolicy", 5)
+
+    # the default topic/queue/function plus one set per shard, and the dead letter queue
+    template.resource_count_is("AWS::SNS::Topic", 4)
+    template.resource_count_is("AWS::SQS::Queue", 5)
+
+    functions = _functions(template)
+
+    assert sorted(
+        function["Properties"]["Environment"]["Variables"]["SHARD_NAME"]
+        for function in functions.values()
+    ) == ["Default", "Shard0", "Shard1", "Shard2"]
+
+    for i, ingestion_shard in enumerate(ingestion_shards):
+        function_logical_id = next(
+            logical_id
+            for logical_id, function in functions.items()
+            if function["Properties"]["Environment"]["Variables"]["SHARD_NAME"]
+            == f"Shard{i}"
+        )
+
+        template.has_resource_properties(
+            "AWS::Lambda::EventSourceMapping",
+            {
+                "FunctionName": {"Ref": function_logical_id},
+                "ScalingConfig": {
+                    "MaximumConcurrency": ingestion_shard.max_concurrency
+                },
+            },
+        )
+
+        template.has_resource_properties(
+            "AWS::Events::Rule",
+            {
+                "EventPattern": {
+                    "account": list(ingestion_shard.account_ids),
+                    "detail-type": ["CloudWatch Alarm State Change"],
+                    "source": ["aws.cloudwatch"],
+                },
+                "Targets": [
+                    Match.object_like(
+                        {
+                            "Arn": {
+                                "Ref": Match.string_like_regexp(
+                                    f"AlarmNotifierShard{i}"
+                                )
+                            }
+                        }
+                    )
+                ],
+            },
+        )
+
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "EventPattern": {
+                "account": [
+                    {
+                        "anything-but": [
+                            "111111111111",
+                            "222222222222",
+                            "333333333333",
+                            "444444444444",
+                        ]
+                    }
+                ],
+                "detail-type": ["CloudWatch Alarm State Change"],
+                "source": ["aws.cloudwatch"],
+            }
+        },
+    )
+
+
+def test_ingestion_shards_must_use_source_accounts():
+    with pytest.raises(
+        cdk.constructs.app_construct.InvalidIngestionShardsError
+    ) as exc_info:
+        _synth(
+            source_account_ids=["111111111111"],
+            ingestion_shards=[
+                cdk.constructs.app_construct.IngestionShard(
+                    account_ids=["111111111111", "222222222222"]
+                ),
+                cdk.constructs.app_construct.IngestionShard(
+                    account_ids=["111111111111"]
+                ),
+            ],
+        )
+
+    assert exc_info.value.unknown_account_ids == ["222222222222"]
+    assert exc_info.value.duplicate_account_ids == ["111111111111"]
@@ -0,0 +1,198 @@
+import json
+
+import alarm_notifier.dlq_redrive
+
+
+def _body(event_id: str, alarm_arn: str, time: str, state: str = "ALARM") -> str:
+    event = {
+        "version": "0",
+        "id": event_id,
+        "detail-type": "CloudWatch Alarm State Change",
+        "source": "aws.cloudwatch",
+        "account": "123456789012",
+        "time": time,
+        "region": "us-east-1",
+        "resources": [alarm_arn],
+        "detail": {
+            "alarmName": alarm_arn.rsplit(":", 1)[-1],
+            "state": {"value": state, "reason": "Threshold Crossed"},
+        },
+    }
+
+    return json.dumps(
+        {
+            "Type": "Notification",
+            "MessageId": event_id,
+            "TopicArn": "arn:aws:sns:us-east-1:123456789012:alarms",
+            "Message": json.dumps(event),
+            "Timestamp": time,
+            "SignatureVersion": "1",
+            "Signature": "signature",
+            "SigningCertURL": "https://sns.us-east-1.amazonaws.com/cert.pem",
+            "UnsubscribeURL": "https://sns.us-east-1.amazonaws.com/unsubscribe",
+        }
+    )
+
+
+def _dead_letter(message_id: str, body: str) -> alarm_notifier.dlq_redrive.DeadLetter:
+    return alarm_notifier.dlq_redrive.parse_dead_letter(
+        {"MessageId": message_id, "ReceiptHandle": message_id, "Body": body}
+    )
+
+
+def _message_ids(dead_letters) -> list:
+    return [dead_letter.message_id for dead_letter in dead_letters]
+
+
+def test_planner():
+    planner = alarm_notifier.dlq_redrive.RedrivePlanner()
+
+    for message_id, body in [
+        ("alarm", _body("e1", "arn:a", "2024-01-01T00:00:00Z")),
+        ("ok", _body("e2", "arn:a", "2024-01-01T00:05:00Z", "OK")),
+        ("ok-again", _body("e2", "arn:a", "2024-01-01T00:05:00Z", "OK")),
+        ("other", _body("e3", "arn:b", "2024-01-01T00:01:00Z")),
+        ("unparsed", "not json"),
+    ]:
+        planner.add(_dead_letter(message_id, body))
+
+    plan = planner.plan()
+
+    # latest state per alarm wins, duplicates are dropped, unparsed letters
+    # are redriven as is
+    assert _message_ids(plan.to_redrive) == ["other", "ok", "unparsed"]
+    assert sorted(_message_ids(plan.to_delete)) == ["alarm", "ok-again"]
+
+
+def test_planner_across_windows():
+    planner = alarm_notifier.dlq_redrive.RedrivePlanner()
+
+    planner.add(_dead_letter("ok", _body("e2", "arn:a", "2024-01-01T00:05:00Z")))
+    planner.mark_redriven(planner.plan().to_redrive)
+
+    for message_id, body in [
+        ("alarm", _body("e1", "arn:a", "2024-01-01T00:00:00Z")),
+        ("ok-again", _body("e2", "arn:a", "2024-01-01T00:05:00Z")),
+        ("later", _body("e4", "arn:a", "2024-01-01T00:10:00Z")),
+    ]:
+        planner.add(_dead_letter(message_id, body))
+
+    plan = planner.plan()
+
+    assert _message_ids(plan.to_redrive) == ["later"]
+    assert sorted(_message_ids(plan.to_delete)) == ["alarm", "ok-again"]
+
+
+def _queues(sqs):
+    dead_letter_queue_url = sqs.create_queue(QueueName="dlq")["QueueUrl"]
+    queue_url = sqs.create_queue(QueueName="queue")["QueueUrl"]
+
+    return dead_letter_queue_url, queue_url
+
+
+def _send(sqs, queue_url: str, bodies: list, **kwargs) -> None:
+    for body in bodies:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=body, **kwargs)
+
+
+def _receive(sqs, queue_url: str) -> list:
+    messages = []
+
+    while True:
+        response = sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=10,
+            MessageAttributeNames=["All"],
+        )
+
+        if not response.get("Messages"):
+            return messages
+
+        messages += response["Messages"]
+
+
+def _redrive(dead_letter_queue_url: str, queue_url: str, *args: str) -> None:
+    alarm_notifier.dlq_redrive.main(
+        [
+            "--dead-letter-queue-url",
+            dead_letter_queue_url,
+            "--queue-url",
+            queue_url,
+            "--rate",
+            "1000",
+            *args,
+        ]
+    )
+
+
+def _send_dead_letters(sqs, dead_letter_queue_url: str) -> None:
+    _send(
+        sqs,
+        dead_letter_queue_url,
+        [
+            _body("e1", "arn:a", "2024-01-01T00:00:00Z"),
+            _body("e2", "arn:a", "2024-01-01T00:05:00Z", "OK"),
+            _body("e2", "arn:a", "2024-01-01T00:05:00Z", "OK"),
+            _body("e3", "arn:b", "2024-01-01T00:01:00Z"),
+            _body("e4", "arn:b", "2024-01-01T00:02:00Z", "OK"),
+        ],
+    )
+    _send(
+        sqs,
+        dead_letter_queue_url,
+        [_body("e5", "arn:c", "2024-01-01T00:00:00Z")],
+        MessageAttributes={"shadow": {"DataType": "String", "StringValue": "true"}},
+    )
+
+
+def _event_ids(messages: list) -> list:
+    return sorted(
+        json.loads(json.loads(message["Body"])["Message"])["id"] for message in messages
+    )
+
+
+def test_redrive(sqs):
+    dead_letter_queue_url, queue_url = _queues(sqs)
+    _send_dead_letters(sqs, dead_letter_queue_url)
+
+    _redrive(dead_letter_queue_url, queue_url, "--window-size", "3")
+
+    messages = _receive(sqs, queue_url)
+
+    assert _event_ids(messages) == ["e2", "e4", "e5"]
+    assert [
+        message["MessageAttributes"]
+        for message in messages
+        if "MessageAttributes" in message
+    ] == [{"shadow": {"DataType": "String", "StringValue": "true"}}]
+    assert _receive(sqs, dead_letter_queue_url) == []
+
+
+def test_redrive_in_small_windows(sqs):
+    dead_letter_queue_url, queue_url = _queues(sqs)
+    _send_dead_letters(sqs, dead_letter_queue_url)
+
+    # e2's duplicate arrives in the window after e2 was redriven, e3 was
+    # redriven before the window holding e4
+    _redrive(dead_letter_queue_url, queue_url, "--window-size", "2")
+
+    assert _event_ids(_receive(sqs, queue_url)) == ["e2", "e3", "e4", "e5"]
+    assert _receive(sqs, dead_letter_queue_url) == []
+
+
+def test_dry_run_leaves_dead_letters_visible(sqs):
+    dead_letter_queue_url, queue_url = _queues(sqs)
+
+    _send(
+        sqs,
+        dead_letter_queue_url,
+        [
+            _body("e1", "arn:a", "2024-01-01T00:00:00Z"),
+            _body("e2", "arn:a", "2024-01-01T00:05:00Z", "OK"),
+        ],
+    )
+
+    _redrive(dead_letter_queue_url, queue_url, "--dry-run")
+
+    assert _receive(sqs, queue_url) == []
+    assert len(_receive(sqs, dead_letter_queue_url)) == 2
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+import alarm_notifier.routing_admin
+from alarm_notifier.routing_admin import Route
+
+
+def _import(tmp_path, rows: str, *args: str) -> None:
+    path = tmp_path / "routes.csv"
+    path.write_text("AlarmArn,SlackChannelId,SinkType\n" + rows)
+
+    alarm_notifier.routing_admin.main(
+        [
+            "--segments",
+            "2",
+            "import",
+            "--input",
+            str(path),
+            "--skip-slack-validation",
+            "--workers",
+            "2",
+            *args,
+        ]
+    )
+
+
+def _routes(routes_table) -> set:
+    return {
+        Route(model.alarm_arn, model.slack_channel_id, model.sink_type)
+        for model in routes_table.scan()
+    }
+
+
+def test_read_routes_rejects_duplicate_keys():
+    file = io.StringIO(
+        "AlarmArn,SlackChannelId,SinkType\n"
+        "arn:a,C1,slack\n"
+        "arn:a,C1,\n"
+        "arn:a,ops@example.com,email\n"
+        "arn:a,ops@example.com,webhook\n"
+    )
+
+    with pytest.raises(alarm_notifier.routing_admin.DuplicateRoutesError) as e:
+        alarm_notifier.routing_admin.read_routes(file, "csv")
+
+    # the same route twice is not a conflict
+    assert e.value.keys == [("arn:a", "ops@example.com")]
+
+
+def test_import_overwrites_changed_sink_type(routes_table, tmp_path):
+    routes_table("arn:a", "ops@example.com", sink_type="webhook").save()
+
+    _import(tmp_path, "arn:a,ops@example.com,email\n", "--prune")
+
+    assert _routes(routes_table) == {Route("arn:a", "ops@example.com", "email")}
+
+
+def test_import_prunes_only_alarms_in_file(routes_table, tmp_path):
+    routes_table("arn:a", "C1", sink_type="slack").save()
+    routes_table("arn:a", "C2", sink_type="slack").save()
+    routes_table("arn:b", "C3", sink_type="slack").save()
+
+    _import(tmp_path, "arn:a,C1,slack\narn:c,C4,\n", "--prune")
+
+    assert _routes(routes_table) == {
+        Route("arn:a", "C1", "slack"),
+        Route("arn:b", "C3", "slack"),
+        Route("arn:c", "C4", "slack"),
+    }
+
+
+def test_import_without_prune_keeps_routes(routes_table, tmp_path):
+    routes_table("arn:a", "C2", sink_type="slack").save()
+
+    _import(tmp_path, "arn:a,C1,slack\n")
+
+    assert _routes(routes_table) == {
+        Route("arn:a", "C1", "slack"),
+        Route("arn:a", "C2", "slack"),
+    }
+
+
+def test_import_dry_run_writes_nothing(routes_table, tmp_path):
+    routes_table("arn:a", "C2", sink_type="slack").save()
+
+    _import(tmp_path, "arn:a,C1,slack\n", "--prune", "--dry-run")
+
+    assert _routes(routes_table) == {Route("arn:a", "C2", "slack")}
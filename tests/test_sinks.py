@@ -0,0 +1,34 @@
+import json
+
+import alarm_notifier.sinks
+
+
+def test_shadow_log_keeps_secrets_out(tmp_path):
+    path = tmp_path / "shadow.jsonl"
+    sinks = alarm_notifier.sinks.RecordingSink.shadowing(
+        sinks={
+            alarm_notifier.sinks.SLACK_SINK_TYPE: alarm_notifier.sinks.WebhookSink(),
+            alarm_notifier.sinks.WEBHOOK_SINK_TYPE: alarm_notifier.sinks.WebhookSink(),
+        },
+        path=str(path),
+        max_bytes=1024 * 1024,
+    )
+    notification = alarm_notifier.sinks.Notification(
+        alarm_arn="arn:a",
+        subject="ALARM: a",
+        text="",
+        slack_blocks=[],
+        payload={"alarm_arn": "arn:a"},
+        state="ALARM",
+    )
+
+    sinks[alarm_notifier.sinks.WEBHOOK_SINK_TYPE].send(
+        notification, ["https://hooks.example.com/services/secret"]
+    )
+    sinks[alarm_notifier.sinks.SLACK_SINK_TYPE].send(notification, ["C1"])
+
+    webhook_line, slack_line = path.read_text().splitlines()
+
+    assert "secret" not in webhook_line
+    assert json.loads(webhook_line)["target_count"] == 1
+    assert json.loads(slack_line)["targets"] == ["C1"]
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+import slack_sdk.errors
+
+import alarm_notifier.sinks
+import alarm_notifier.slack_channels
+
+
+class FakeSlackClient:
+    def __init__(self, channels: dict):
+        self.channels = channels
+        self.retry_handlers = []
+        self.listings = 0
+        self.listing = threading.Event()
+        self.listed = threading.Event()
+        self.posts = []
+
+    def conversations_list(self, **kwargs):
+        self.listings += 1
+        self.listing.wait(timeout=5)
+
+        yield {
+            "channels": [
+                {"id": channel_id, "name": name}
+                for name, channel_id in self.channels.items()
+            ]
+        }
+
+        self.listed.set()
+
+    def chat_postMessage(self, channel: str, **kwargs):
+        if channel not in self.channels.values():
+            raise slack_sdk.errors.SlackApiError(
+                "channel_not_found", {"ok": False, "error": "channel_not_found"}
+            )
+
+        self.posts.append(channel)
+
+        return {"ts": "1.0"}
+
+
+def _index(slack_client: FakeSlackClient, **kwargs):
+    slack_client.listing.set()
+
+    index = alarm_notifier.slack_channels.SlackChannelIndex(
+        client_factory=lambda: slack_client, **kwargs
+    )
+    index.refresh()
+
+    return index
+
+
+def test_missing_channel_refreshes_in_background():
+    slack_client = FakeSlackClient({"ops": "C1"})
+    index = _index(slack_client, min_refresh_interval_seconds=0)
+
+    slack_client.channels["new"] = "C2"
+    slack_client.listing.clear()
+    slack_client.listed.clear()
+
+    # the record does not wait for the rebuild
+    with pytest.raises(alarm_notifier.slack_channels.UnknownSlackChannelError):
+        index.resolve("#new")
+
+    slack_client.listing.set()
+    assert slack_client.listed.wait(timeout=5)
+    index._refresh_thread.join(timeout=5)
+
+    assert index.resolve("#new") == "C2"
+    assert slack_client.listings == 2
+
+
+def test_missing_channel_refreshes_once_until_ttl():
+    slack_client = FakeSlackClient({"ops": "C1"})
+    index = _index(slack_client, min_refresh_interval_seconds=0)
+
+    for _ in range(3):
+        with pytest.raises(alarm_notifier.slack_channels.UnknownSlackChannelError):
+            index.resolve("#missing")
+
+        if index._refresh_thread is not None:
+            index._refresh_thread.join(timeout=5)
+
+    assert slack_client.listings == 2
+
+
+def test_sink_skips_unknown_channels():
+    slack_client = FakeSlackClient({"ops": "C1"})
+    sink = alarm_notifier.sinks.SlackSink(
+        client_factory=lambda: slack_client,
+        channel_index=_index(slack_client),
+    )
+
+    sink.send(
+        alarm_notifier.sinks.Notification(
+            alarm_arn="arn:a",
+            subject="ALARM: a",
+            text="",
+            slack_blocks=[],
+            payload={},
+            state="ALARM",
+        ),
+        ["#missing", "#ops"],
+    )
+
+    assert slack_client.posts == ["C1"]